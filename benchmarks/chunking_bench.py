@@ -0,0 +1,84 @@
+# benchmarks/chunking_bench.py → Chunker benchmark for mcp_server_2
+# Role: Compare the embedding chunker with the phi4 semantic_merge segmenter.
+
+# Builds a mixed-topic corpus by interleaving paragraphs from the text
+# documents in documents/, chunks it with each method and reports:
+#   - wall time and chunks produced
+#   - purity: share of chunks whose sentences all come from one source
+#   - hit@k: a sentence used as the query finds a chunk containing it
+# Needs the Ollama endpoints configured in mcp_server_2.py.
+
+# Usage:
+# python -m benchmarks.chunking_bench
+# python -m benchmarks.chunking_bench --methods embedding --k 3
+
+import argparse
+import random
+import time
+import numpy as np
+
+import mcp_server_2 as rag
+
+SOURCES = ["cricket.txt", "dlf.md", "economic.md", "markitdown.md"]
+
+
+def build_corpus(seed: int) -> tuple[str, dict[str, str]]:
+    """Interleave paragraphs of different documents; map each sentence to its source."""
+    paragraphs = []
+    for name in SOURCES:
+        path = rag.ROOT / "documents" / name
+        if path.exists():
+            text = path.read_text(encoding="utf-8", errors="ignore")
+            paragraphs += [(name, p.strip()) for p in text.split("\n\n") if len(p.split()) > 20]
+    random.Random(seed).shuffle(paragraphs)
+
+    source_of = {}
+    for name, paragraph in paragraphs:
+        for sentence in rag.split_sentences(paragraph):
+            source_of[" ".join(sentence.split())] = name
+    return "\n\n".join(p for _, p in paragraphs), source_of
+
+
+def purity(chunks: list[str], source_of: dict[str, str]) -> float:
+    pure = 0
+    for chunk in chunks:
+        sources = {src for sentence, src in source_of.items() if sentence in chunk}
+        pure += len(sources) <= 1
+    return pure / max(len(chunks), 1)
+
+
+def hit_at_k(chunks: list[str], queries: list[str], k: int) -> float:
+    chunk_vecs = rag.get_embeddings(chunks)
+    query_vecs = rag.get_embeddings(queries)
+    dists = ((query_vecs[:, None, :] - chunk_vecs[None, :, :]) ** 2).sum(-1)
+    top = np.argsort(dists, axis=1)[:, :k]
+    return float(np.mean([any(q in chunks[j] for j in row) for q, row in zip(queries, top)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document chunkers")
+    parser.add_argument("--methods", nargs="+", default=["embedding", "llm"])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    text, source_of = build_corpus(args.seed)
+    rng = random.Random(args.seed)
+    queries = rng.sample([s for s in source_of if len(s.split()) > 6], k=min(args.queries, len(source_of)))
+    print(f"Corpus: {len(text.split())} words, {len(source_of)} sentences, {len(queries)} queries")
+
+    print(f"{'method':<12}{'seconds':>10}{'chunks':>8}{'purity':>9}{f'hit@{args.k}':>9}")
+    for method in args.methods:
+        start = time.perf_counter()
+        chunks = rag.chunk_document(text, method)
+        elapsed = time.perf_counter() - start
+        chunks = [" ".join(c.split()) for c in chunks if c.strip()]
+        print(
+            f"{method:<12}{elapsed:>10.2f}{len(chunks):>8}"
+            f"{purity(chunks, source_of):>9.2f}{hit_at_k(chunks, queries, args.k):>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
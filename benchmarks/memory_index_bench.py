@@ -0,0 +1,83 @@
+# benchmarks/memory_index_bench.py → MemoryManager index benchmark
+# Role: Compare FAISS index types for agent memory at scale.
+
+# Reports recall@k against an exact flat index and queries/sec for each
+# index factory string, on synthetic clustered vectors (no embedding server).
+
+# Usage:
+# python -m benchmarks.memory_index_bench
+# python -m benchmarks.memory_index_bench --sizes 10000 100000 --dim 768 --k 3
+
+import argparse
+import time
+import numpy as np
+import faiss
+
+from modules.memory import create_index, search_params
+
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0, n_clusters: int = 256) -> np.ndarray:
+    """Gaussian blobs, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    return centers[labels] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def default_factories(n: int, dim: int, pq_m: int) -> list[str]:
+    nlist = max(16, int(4 * np.sqrt(n)))
+    return ["Flat", "HNSW32", f"IVF{nlist},Flat", f"IVF{nlist},PQ{pq_m}"]
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(t) & set(f[f >= 0])) for t, f in zip(truth, found))
+    return hits / truth.size
+
+
+def run(n: int, dim: int, k: int, n_queries: int, factories: list[str], nprobe: int, ef_search: int):
+    xb = synthetic_vectors(n, dim, seed=1)
+    xq = synthetic_vectors(n_queries, dim, seed=2)
+
+    flat = faiss.IndexFlatL2(dim)
+    flat.add(xb)
+    _, truth = flat.search(xq, k)
+
+    print(f"\n=== {n:,} memories, dim={dim}, k={k}, {n_queries} queries ===")
+    print(f"{'index':<22}{'build s':>10}{'recall@k':>10}{'QPS':>12}")
+    for factory in factories:
+        start = time.perf_counter()
+        index = create_index(factory, dim)
+        if not index.is_trained:
+            rng = np.random.default_rng(3)
+            sample = xb[rng.choice(n, size=min(n, 100_000), replace=False)]
+            index.train(sample)
+        index.add(xb)
+        build = time.perf_counter() - start
+
+        params = search_params(index, nprobe=nprobe, ef_search=ef_search)
+        start = time.perf_counter()
+        _, found = index.search(xq, k, params=params)
+        elapsed = time.perf_counter() - start
+
+        print(f"{factory:<22}{build:>10.2f}{recall_at_k(truth, found):>10.3f}{n_queries / elapsed:>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MemoryManager index types")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--pq-m", type=int, default=32, help="PQ sub-quantizers (must divide dim)")
+    parser.add_argument("--factories", nargs="+", help="Override the index factory strings")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        factories = args.factories or default_factories(n, args.dim, args.pq_m)
+        run(n, args.dim, args.k, args.queries, factories, args.nprobe, args.ef_search)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# benchmarks/memory_storage_bench.py → MemoryManager storage benchmark
+# Role: Measure footprint vs. retrieval quality of the compact storage modes.
+
+# For every storage mode (float32, float16, sq8, pq) with and without exact
+# re-ranking, reports bytes per vector, recall@k against the exact flat
+# baseline and queries/sec, on synthetic clustered vectors.
+
+# Usage:
+# python -m benchmarks.memory_storage_bench
+# python -m benchmarks.memory_storage_bench --n 100000 --index-factory HNSW32
+
+import argparse
+import time
+import faiss
+
+from modules.memory import STORAGE_CODECS, compose_factory, create_index, search_params
+from benchmarks.memory_index_bench import synthetic_vectors, recall_at_k
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MemoryManager storage modes")
+    parser.add_argument("--n", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--index-factory", default="Flat")
+    parser.add_argument("--pq-m", type=int, default=32)
+    parser.add_argument("--k-factor", type=int, default=4)
+    args = parser.parse_args()
+
+    xb = synthetic_vectors(args.n, args.dim, seed=1)
+    xq = synthetic_vectors(args.queries, args.dim, seed=2)
+
+    flat = faiss.IndexFlatL2(args.dim)
+    flat.add(xb)
+    _, truth = flat.search(xq, args.k)
+
+    print(f"=== {args.n:,} memories, dim={args.dim}, k={args.k}, base={args.index_factory} ===")
+    print(f"{'factory':<28}{'bytes/vec':>10}{'MB':>10}{'recall@k':>10}{'QPS':>12}")
+    factories = dict.fromkeys(
+        compose_factory(args.index_factory, storage, rerank, args.pq_m)
+        for storage in STORAGE_CODECS
+        for rerank in (False, True)
+    )
+    for factory in factories:
+        index = create_index(factory, args.dim)
+        if not index.is_trained:
+            index.train(xb[:min(args.n, 100_000)])
+        index.add(xb)
+
+        size = faiss.serialize_index(index).nbytes
+        params = search_params(index, k_factor=args.k_factor)
+        start = time.perf_counter()
+        _, found = index.search(xq, args.k, params=params)
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"{factory:<28}{size // args.n:>10}{size / 2**20:>10.1f}"
+            f"{recall_at_k(truth, found):>10.3f}{args.queries / elapsed:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# benchmarks/ollama_stub.py → Deterministic local stand-in for the Ollama API
+# Role: Let benchmarks run ingestion and search without Ollama or a GPU.
+
+# Serves the endpoints mcp_server_2.py and MemoryManager call:
+#   - POST /api/embed       {"input": str | [str]}  → {"embeddings": [[...], ...]}
+#   - POST /api/embeddings  {"prompt": str}         → {"embedding": [...]}
+#   - POST /api/chat        semantic_merge / are_related prompts → deterministic reply
+#   - POST /api/generate    image captions (streamed JSON lines)
+# Embeddings are hashed bag-of-words: every word maps to a fixed random unit
+# vector and a text is the normalized sum, so texts sharing words are close
+# and the same text always gets the same vector. --latency-ms adds a fixed
+# delay per request to mimic model time.
+
+# Usage:
+# python -m benchmarks.ollama_stub --port 11434
+# (from code) url = ollama_stub.start(); rag.EMBED_URL = f"{url}/api/embed"
+
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+DIM = 768  # nomic-embed-text
+LATENCY_MS = 0.0
+
+
+@lru_cache(maxsize=200_000)
+def word_vector(word: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+    vector = np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def embed(text: str) -> list[float]:
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return [0.0] * DIM
+    vector = np.sum([word_vector(word) for word in words], axis=0)
+    return (vector / (np.linalg.norm(vector) + 1e-12)).tolist()
+
+
+def chat_reply(prompt: str) -> str:
+    # semantic_merge: hand back the chunk from its second markdown heading on, if it has one
+    chunk = prompt.split("---", 2)[1] if prompt.count("---") >= 2 else ""
+    second = [m.start() for m in re.finditer(r"^#+ ", chunk, re.M)][1:2]
+    if second:
+        return chunk[second[0]:].strip()
+    # are_related: one-word Yes / No
+    return "No" if "Yes or No" in prompt else ""
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if LATENCY_MS:
+            time.sleep(LATENCY_MS / 1000)
+
+        if self.path == "/api/embed":
+            texts = body.get("input", [])
+            texts = [texts] if isinstance(texts, str) else texts
+            self.send_json({"model": body.get("model"), "embeddings": [embed(text) for text in texts]})
+        elif self.path == "/api/embeddings":
+            self.send_json({"embedding": embed(body.get("prompt", ""))})
+        elif self.path == "/api/chat":
+            prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+            self.send_json({"message": {"role": "assistant", "content": chat_reply(prompt)}, "done": True})
+        elif self.path == "/api/generate":
+            lines = [{"response": "A synthetic image.", "done": False}, {"response": "", "done": True}]
+            self.send_payload("\n".join(json.dumps(line) for line in lines).encode(), "application/x-ndjson")
+        else:
+            self.send_error(404)
+
+    def send_json(self, data: dict):
+        self.send_payload(json.dumps(data).encode(), "application/json")
+
+    def send_payload(self, payload: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start(port: int = 0, host: str = "127.0.0.1") -> str:
+    """Serve on a background thread (port 0 = any free port); returns the base URL."""
+    server = ThreadingHTTPServer((host, port), OllamaStubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    global DIM, LATENCY_MS
+    parser = argparse.ArgumentParser(description="Deterministic Ollama stand-in for benchmarks")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--dim", type=int, default=DIM)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    DIM, LATENCY_MS = args.dim, args.latency_ms
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), OllamaStubHandler)
+    print(f"Ollama stub on http://127.0.0.1:{args.port} (dim={DIM}, latency={LATENCY_MS} ms)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
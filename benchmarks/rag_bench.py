@@ -0,0 +1,236 @@
+# benchmarks/rag_bench.py → End-to-end RAG benchmark for mcp_server_2
+# Role: Track ingestion throughput, search latency and retrieval quality over releases.
+
+# For each corpus size, writes a synthetic markdown corpus (topic sections
+# under "## " headings, roughly one chunk each), indexes it with process_documents
+# against the deterministic Ollama stub (benchmarks/ollama_stub.py) and reports:
+#   - docs/s and chunks/s of process_documents, and its wall time
+#   - build s: training and re-encoding into INDEX_FACTORY done during ingest
+#     (0 for Flat, whose vectors are added as they are embedded)
+#   - peak RSS of this process and its extraction workers, index.bin + chunks.db size
+#   - p50/p99 latency of a full search (embed + retrieve + fetch), recall@k
+#     (a query of words sampled from one sentence finds the chunk holding it)
+# Everything runs in a temporary directory; the real documents/ and
+# faiss_index/ are not touched. Results can be saved as a baseline; later
+# runs flag metrics that got worse by more than --tolerance and exit 1.
+# Sizes of 100k+ chunks take a long time (every chunk and sentence is embedded
+# over HTTP) and need several GB of disk.
+
+# Usage:
+# python -m benchmarks.rag_bench
+# python -m benchmarks.rag_bench --sizes 1000 10000 100000 --save-baseline
+# python -m benchmarks.rag_bench --index-factory SQ8 --mode dense --k 3
+
+import argparse
+import json
+import logging
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+
+import mcp_server_2 as rag
+from benchmarks import ollama_stub
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASELINE = Path(__file__).parent / "rag_bench_baseline.json"
+HIGHER_IS_BETTER = {"docs_per_s", "chunks_per_s", "recall"}
+NOISE_FLOOR = {"build_s": 0.05, "ingest_s": 0.5, "p50_ms": 1.0, "p99_ms": 2.0}  # differences this small are jitter
+METRICS = ["docs_per_s", "chunks_per_s", "ingest_s", "build_s", "peak_rss_mb", "disk_mb", "p50_ms", "p99_ms", "recall"]
+
+
+def vocabulary(n: int, rng: random.Random) -> list[str]:
+    syllables = ["ka", "lo", "mi", "ten", "ru", "sha", "vo", "pel", "dri", "um", "zo", "bar", "nex", "qui", "tor"]
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def write_corpus(doc_dir: Path, n_chunks: int, sections_per_doc: int, seed: int) -> list[tuple[str, str]]:
+    """Markdown docs of topic sections; returns (doc, sentence) pairs to build queries from."""
+    rng = random.Random(seed)
+    words = vocabulary(20_000, rng)
+    common = ["the", "of", "and", "in", "to", "is", "for", "with", "on", "by"]
+    topics = [rng.sample(words, 40) for _ in range(500)]
+
+    sentences = []
+    n_docs = -(-n_chunks // sections_per_doc)
+    for d in range(n_docs):
+        sections = []
+        for s in range(min(sections_per_doc, n_chunks - d * sections_per_doc)):
+            topic = rng.choice(topics)
+            lines = [
+                " ".join(rng.choice(topic if rng.random() < 0.7 else common) for _ in range(rng.randint(12, 18))).capitalize() + "."
+                for _ in range(10)  # ~10% of sentence gaps are topic shifts, matching CHUNK_BREAKPOINT_PERCENTILE
+            ]
+            sentences += [(f"doc_{d:06d}.md", line) for line in lines]
+            sections.append(f"## Section {s}: {topic[0]}\n\n" + " ".join(lines))
+        (doc_dir / f"doc_{d:06d}.md").write_text("\n\n".join(sections), encoding="utf-8")
+    return sentences
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return float("nan")
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return usage / 2**20 if sys.platform == "darwin" else usage / 2**10  # bytes on macOS, KiB elsewhere
+
+
+def quiet():
+    """Drop per-file ingestion logs; runs here and, as EXTRACT_WORKER_INIT, in every extraction worker."""
+    rag.mcp_log = lambda level, message: None
+
+
+def bench_size(n_chunks: int, args) -> dict:
+    work = Path(tempfile.mkdtemp(prefix="rag_bench_"))
+    try:
+        rag.DOC_DIR, rag.INDEX_DIR = work / "documents", work / "faiss_index"
+        rag.CAPTION_CACHE = rag.INDEX_DIR / "captions.db"
+        rag._shards.clear()
+        rag.DOC_DIR.mkdir()
+        sentences = write_corpus(rag.DOC_DIR, n_chunks, args.sections_per_doc, args.seed)
+        n_docs = len(list(rag.DOC_DIR.iterdir()))
+
+        builds = []
+        rebuild_index = rag.rebuild_index
+
+        def timed_rebuild(*args):
+            start = time.perf_counter()
+            try:
+                return rebuild_index(*args)
+            finally:
+                builds.append(time.perf_counter() - start)
+
+        rag.rebuild_index = timed_rebuild
+        try:
+            start = time.perf_counter()
+            rag.process_documents()
+            ingest = time.perf_counter() - start
+        finally:
+            rag.rebuild_index = rebuild_index
+
+        store = rag.open_chunk_store(rag.get_shard().db_path)
+        chunks = store.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        factory = rag.get_meta(store, "index_factory", "Flat")
+        store.close()
+
+        rng = random.Random(args.seed + 1)
+        latencies, hits = [], 0
+        for doc, sentence in rng.sample(sentences, min(args.queries, len(sentences))):
+            words = sentence.rstrip(".").split()
+            query = " ".join(rng.sample(words, min(8, len(words))))
+            start = time.perf_counter()
+            results = rag.run_search([query], args.mode, None, False, 0, k=args.k)[0]
+            latencies.append(time.perf_counter() - start)
+            hits += any(hit["doc"] == doc and sentence in hit["chunk"] for hit in results)
+
+        disk = sum(path.stat().st_size for path in rag.INDEX_DIR.rglob("*") if path.is_file())
+        return {
+            "docs": n_docs,
+            "chunks": chunks,
+            "factory": factory,
+            "docs_per_s": n_docs / ingest,
+            "chunks_per_s": chunks / ingest,
+            "ingest_s": ingest,
+            "build_s": sum(builds),
+            "peak_rss_mb": peak_rss_mb(),
+            "disk_mb": disk / 2**20,
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p99_ms": float(np.percentile(latencies, 99) * 1000),
+            "recall": hits / len(latencies),
+        }
+    finally:
+        rag._shards.clear()
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def regressions(results: dict, baseline: dict, tolerance: float, recall_drop: float) -> list[str]:
+    """Metrics worse than the baseline run of the same size by more than the tolerance."""
+    found = []
+    for size, row in results.items():
+        base = baseline.get("results", {}).get(size)
+        if not base:
+            continue
+        for metric in METRICS:
+            old, new = base.get(metric), row[metric]
+            if old is None or not np.isfinite(old) or not np.isfinite(new) or abs(new - old) <= NOISE_FLOOR.get(metric, 0):
+                continue
+            if metric == "recall":
+                worse = new < old - recall_drop
+            elif metric in HIGHER_IS_BETTER:
+                worse = new < old * (1 - tolerance)
+            else:
+                worse = new > old * (1 + tolerance)
+            if worse:
+                found.append(f"{size} chunks: {metric} {old:.3f} → {new:.3f}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RAG ingestion and search")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000], help="corpus sizes in chunks (1k-1M)")
+    parser.add_argument("--sections-per-doc", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--mode", default=rag.SEARCH_MODE, choices=["hybrid", "dense", "lexical"])
+    parser.add_argument("--index-factory", default=rag.INDEX_FACTORY)
+    parser.add_argument("--dim", type=int, default=ollama_stub.DIM, help="embedding size served by the stub")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="stub delay per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown/growth flagged")
+    parser.add_argument("--recall-drop", type=float, default=0.02, help="absolute recall loss flagged")
+    args = parser.parse_args()
+
+    ollama_stub.DIM, ollama_stub.LATENCY_MS = args.dim, args.latency_ms
+    url = ollama_stub.start()
+    rag.EMBED_URL, rag.OLLAMA_CHAT_URL, rag.OLLAMA_URL = f"{url}/api/embed", f"{url}/api/chat", f"{url}/api/generate"
+    rag.INDEX_FACTORY = args.index_factory
+    quiet()  # keep per-file ingestion logs out of the report
+    rag.EXTRACT_WORKER_INIT = quiet
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    config = {"mode": args.mode, "k": args.k, "index_factory": args.index_factory, "dim": args.dim,
+              "chunker": rag.CHUNKER, "queries": args.queries, "sections_per_doc": args.sections_per_doc}
+    print(f"=== mode={args.mode}, k={args.k}, index={args.index_factory}, dim={args.dim}, {args.queries} queries ===")
+    print(f"{'chunks':>9}{'docs':>8}{'docs/s':>9}{'chunks/s':>10}{'ingest s':>10}{'build s':>9}"
+          f"{'RSS MB':>9}{'disk MB':>9}{'p50 ms':>8}{'p99 ms':>8}{f'recall@{args.k}':>10}")
+    results = {}
+    for size in args.sizes:
+        row = bench_size(size, args)
+        results[str(size)] = row
+        print(f"{row['chunks']:>9}{row['docs']:>8}{row['docs_per_s']:>9.1f}{row['chunks_per_s']:>10.0f}"
+              f"{row['ingest_s']:>10.1f}{row['build_s']:>9.2f}{row['peak_rss_mb']:>9.0f}{row['disk_mb']:>9.1f}"
+              f"{row['p50_ms']:>8.1f}{row['p99_ms']:>8.1f}{row['recall']:>10.3f}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps({"config": config, "results": results}, indent=2), encoding="utf-8")
+        print(f"Saved baseline to {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if baseline.get("config") != config:
+        print(f"WARNING: baseline was recorded with {baseline.get('config')}")
+    found = regressions(results, baseline, args.tolerance, args.recall_drop)
+    if found:
+        print("REGRESSIONS vs baseline:")
+        for line in found:
+            print(f"  {line}")
+        sys.exit(1)
+    print("No regressions vs baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/rag_index_bench.py → Document index encoding benchmark for mcp_server_2
+# Role: Measure footprint vs. retrieval quality of compressed and truncated document indexes.
+
+# For every Matryoshka dimension (EMBED_DIM) and index factory (INDEX_FACTORY,
+# INDEX_REFINE) reports bytes per vector, build time, recall@k against exact
+# search on the full-size vectors and p50 query latency.
+# Vectors come from an existing faiss_index/index.bin (real nomic embeddings)
+# or, without --index, from synthetic clustered vectors. Synthetic vectors
+# aren't Matryoshka-trained, so only --index gives meaningful truncated rows.
+
+# Usage:
+# python -m benchmarks.rag_index_bench
+# python -m benchmarks.rag_index_bench --index faiss_index/index.bin --dims 768 256
+
+import argparse
+import time
+import numpy as np
+import faiss
+
+import mcp_server_2 as rag
+from modules.memory import search_params
+from benchmarks.memory_index_bench import synthetic_vectors, recall_at_k
+
+FACTORIES = ["Flat", "SQ8", "PQ32", "IVF{nlist},PQ32,RFlat"]
+
+
+def load_vectors(path: str, n_queries: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """Split the exact vectors of an index.bin into a base set and held-out queries."""
+    exact = rag.exact_vectors(rag.load_id_index(rag.Path(path)))
+    if exact is None:
+        raise SystemExit(f"{path} holds no exact vectors")
+    vectors = exact[0]
+    order = np.random.default_rng(seed).permutation(len(vectors))
+    return vectors[order[n_queries:]], vectors[order[:n_queries]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document index encodings")
+    parser.add_argument("--index", help="index.bin to take real vectors from")
+    parser.add_argument("--n", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dims", type=int, nargs="+", default=[768, 512, 256])
+    parser.add_argument("--factories", nargs="+", default=FACTORIES)
+    parser.add_argument("--nprobe", type=int, default=rag.INDEX_NPROBE)
+    parser.add_argument("--k-factor", type=int, default=rag.INDEX_REFINE_K_FACTOR)
+    args = parser.parse_args()
+
+    if args.index:
+        xb, xq = load_vectors(args.index, args.queries, seed=0)
+    else:
+        xb = synthetic_vectors(args.n, 768, seed=1)
+        xq = synthetic_vectors(args.queries, 768, seed=2)
+        # nomic embeddings are unit length
+        xb /= np.linalg.norm(xb, axis=1, keepdims=True)
+        xq /= np.linalg.norm(xq, axis=1, keepdims=True)
+    n, full_dim = xb.shape
+
+    flat = faiss.IndexFlatL2(full_dim)
+    flat.add(xb)
+    _, truth = flat.search(xq, args.k)
+
+    print(f"=== {n:,} chunks, {len(xq)} queries, k={args.k}, nprobe={args.nprobe} ===")
+    print(f"{'dim':>5}  {'factory':<24}{'bytes/vec':>10}{'MB':>9}{'build s':>9}{f'recall@{args.k}':>10}{'p50 ms':>9}")
+    ids = np.arange(n, dtype=np.int64)
+    for dim in args.dims:
+        rag.EMBED_DIM = dim if dim < full_dim else 0
+        base, queries = rag.matryoshka(xb), rag.matryoshka(xq)
+        for template in args.factories:
+            factory = rag.resolve_factory(template, n)
+            start = time.perf_counter()
+            index = rag.build_index(base, ids, factory)
+            build = time.perf_counter() - start
+
+            size = faiss.serialize_index(index).nbytes
+            params = search_params(
+                rag.inner_index(index), nprobe=args.nprobe, k_factor=args.k_factor
+            )
+            latencies = []
+            found = np.empty((len(queries), args.k), dtype=np.int64)
+            for row, query in enumerate(queries):
+                start = time.perf_counter()
+                _, I = index.search(query[None, :], args.k, params=params)
+                latencies.append(time.perf_counter() - start)
+                found[row] = I[0]
+
+            print(
+                f"{base.shape[1]:>5}  {factory:<24}{size // n:>10}{size / 2**20:>9.1f}{build:>9.2f}"
+                f"{recall_at_k(truth, found):>10.3f}{np.percentile(latencies, 50) * 1000:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
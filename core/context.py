@@ -60,7 +60,21 @@ class AgentContext:
         self.step = 0
         self.memory = MemoryManager(
             embedding_model_url=self.agent_profile.memory_config["embedding_url"],
-            model_name=self.agent_profile.memory_config["embedding_model"]
+            model_name=self.agent_profile.memory_config["embedding_model"],
+            index_factory=self.agent_profile.memory_config.get("index_factory", "Flat"),
+            nprobe=self.agent_profile.memory_config.get("nprobe", 16),
+            ef_search=self.agent_profile.memory_config.get("ef_search", 64),
+            train_size=self.agent_profile.memory_config.get("train_size", 0),
+            storage=self.agent_profile.memory_config.get("storage", "float32"),
+            pq_m=self.agent_profile.memory_config.get("pq_m", 32),
+            rerank=self.agent_profile.memory_config.get("rerank", False),
+            rerank_k_factor=self.agent_profile.memory_config.get("rerank_k_factor", 4),
+            write_behind=self.agent_profile.memory_config.get("write_behind", False),
+            write_batch_size=self.agent_profile.memory_config.get("write_batch_size", 16),
+            embedding_batch_url=self.agent_profile.memory_config.get("embedding_batch_url"),
+            lifecycle=self.agent_profile.memory_config.get("lifecycle"),
+            dedup_threshold=self.agent_profile.memory_config.get("dedup_threshold", 0.0),
+            compact_ratio=self.agent_profile.memory_config.get("compact_ratio", 0.25)
         )
         self.memory_trace: List[MemoryItem] = []
         self.tool_calls: List[ToolCallTrace] = []
@@ -72,6 +86,7 @@ class AgentContext:
 
     def add_memory(self, item: MemoryItem):
         self.memory_trace.append(item)
+        # Queued when write_behind is on; retrieve() waits only if it needs this item
         self.memory.add(item)
 
     def __repr__(self):
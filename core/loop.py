@@ -9,6 +9,9 @@ from modules.action import ToolCallResult, parse_function_call
 from modules.memory import MemoryItem
 import json
 
+NO_RELEVANT_RESULTS = "NO_RELEVANT_RESULTS"  # mcp_server_2 search result with nothing above its cutoff
+FALLBACK_SEARCH_TOOL = "search"  # web search (mcp_server_3) tried when the documents have nothing relevant
+
 
 class AgentLoop:
     def __init__(self, user_input: str, dispatcher: MultiMCP):
@@ -23,6 +26,20 @@ class AgentLoop:
         parameters = getattr(tool, "parameters", {})
         return list(parameters.keys()) == ["input"]
 
+    def has_tool(self, tool_name: str) -> bool:
+        return any(getattr(t, "name", None) == tool_name for t in self.tools)
+
+    async def call_tool_text(self, tool_name: str, tool_input: dict) -> str:
+        response = await self.mcp.call_tool(tool_name, tool_input)
+
+        # ✅ Safe TextContent parsing
+        raw = getattr(response.content, 'text', str(response.content))
+        try:
+            result_obj = json.loads(raw) if raw.strip().startswith("{") else raw
+        except json.JSONDecodeError:
+            result_obj = raw
+
+        return result_obj.get("markdown", raw) if isinstance(result_obj, dict) else str(result_obj)
     
 
     async def run(self) -> str:
@@ -118,18 +135,18 @@ class AgentLoop:
                     else:
                         tool_input = arguments
 
-                    response = await self.mcp.call_tool(tool_name, tool_input)
-
-                    # ✅ Safe TextContent parsing
-                    raw = getattr(response.content, 'text', str(response.content))
-                    try:
-                        result_obj = json.loads(raw) if raw.strip().startswith("{") else raw
-                    except json.JSONDecodeError:
-                        result_obj = raw
-
-                    result_str = result_obj.get("markdown") if isinstance(result_obj, dict) else str(result_obj)
+                    result_str = await self.call_tool_text(tool_name, tool_input)
                     print(f"[action] {tool_name} → {result_str}")
 
+                    # 🔀 Nothing relevant in the documents: reroute to web search without another planning round
+                    if (
+                        tool_name == "search_documents" and NO_RELEVANT_RESULTS in result_str
+                        and "query" in arguments and self.has_tool(FALLBACK_SEARCH_TOOL)
+                    ):
+                        tool_name, arguments = FALLBACK_SEARCH_TOOL, {"query": arguments["query"]}
+                        result_str = await self.call_tool_text(tool_name, arguments)
+                        print(f"[action] {tool_name} (rerouted) → {result_str}")
+
                     # 🧠 Add memory
                     memory_item = MemoryItem(
                         text=f"{tool_name}({arguments}) → {result_str}",
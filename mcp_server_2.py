@@ -13,37 +13,152 @@ from pathlib import Path
 import requests
 from markitdown import MarkItDown
 import time
-from models import AddInput, AddOutput, SqrtInput, SqrtOutput, StringsToIntsInput, StringsToIntsOutput, ExpSumInput, ExpSumOutput, PythonCodeInput, PythonCodeOutput, UrlInput, FilePathInput, MarkdownInput, MarkdownOutput, ChunkListOutput
+from modules.memory import compose_factory, create_index, search_params
+from models import AddInput, AddOutput, SqrtInput, SqrtOutput, StringsToIntsInput, StringsToIntsOutput, ExpSumInput, ExpSumOutput, PythonCodeInput, PythonCodeOutput, UrlInput, FilePathInput, MarkdownInput, MarkdownOutput, ChunkListOutput, SearchHit, SearchDocumentsOutput
 from tqdm import tqdm
 import hashlib
 from pydantic import BaseModel
 import subprocess
 import sqlite3
 import trafilatura
+import pymupdf
 import pymupdf4llm
 import re
 import base64 # ollama needs base64-encoded-image
+import threading
+import queue
+import asyncio
+import concurrent.futures
+import multiprocessing
+import httpx
+try:
+    from watchdog.observers import Observer  # inotify / ReadDirectoryChangesW / FSEvents
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # stat polling fallback below
+    Observer = None
+from typing import AsyncIterator, Optional
 
 
 mcp = FastMCP("Calculator")
 
-EMBED_URL = "http://localhost:11434/api/embeddings"
+EMBED_URL = "http://localhost:11434/api/embed"  # list input; one request embeds a whole batch
 OLLAMA_CHAT_URL = "http://localhost:11434/api/chat"
 OLLAMA_URL = "http://localhost:11434/api/generate"
 EMBED_MODEL = "nomic-embed-text"
+EMBED_DIM = 0  # Matryoshka truncation: keep the first N dims of nomic-embed-text (e.g. 512, 256; 0 = all 768)
 GEMMA_MODEL = "gemma3:12b"
 PHI_MODEL = "phi4:latest"
 CHUNK_SIZE = 256
 CHUNK_OVERLAP = 40
 MAX_CHUNK_LENGTH = 512  # characters
 TOP_K = 3  # FAISS top-K matches
+CHUNKER = "embedding"  # "embedding" (sentence-embedding breakpoints) or "llm" (phi4 semantic_merge)
+COLLECTION_CHUNKERS: dict[str, str] = {}  # per-collection override of CHUNKER, e.g. {"contracts": "llm"}
+CHUNK_MAX_WORDS = 512
+CHUNK_MIN_WORDS = 40  # don't split on a topic shift before a chunk has this many words
+CHUNK_BREAKPOINT_PERCENTILE = 90  # split where sentence-to-sentence distance exceeds this percentile
+CHUNK_OVERLAP_SENTENCES = 1  # sentences repeated at the start of the next chunk
+EMBED_BATCH_SIZE = 32  # chunks per embedding request
+EMBED_CONCURRENCY = 4  # embedding requests in flight
+EMBED_RETRIES = 3
+EXTRACT_WORKERS = os.cpu_count() or 2  # processes running pymupdf4llm / MarkItDown / trafilatura
+EXTRACT_WORKER_INIT = None  # module-level function each extraction worker runs at start (e.g. to silence mcp_log)
+PIPELINE_CONCURRENCY = 2  # files captioned, chunked and embedded at once
+PIPELINE_QUEUE_SIZE = 4  # files buffered between pipeline stages
+PIPELINE_MAX_IN_FLIGHT = 16  # files started but not yet committed; bounds the commit reorder buffer
+CAPTION_CONCURRENCY = 4  # gemma3 caption requests in flight
+PDF_STREAM_MIN_PAGES = 40  # larger PDFs are extracted, captioned and chunked page batch by page batch
+PDF_PAGE_BATCH = 8  # pages held in memory at once when streaming
 ROOT = Path(__file__).parent.resolve()
+DOC_DIR = ROOT / "documents"  # files here form the default collection, each subfolder a named one
+INDEX_DIR = ROOT / "faiss_index"  # default collection's shard; named ones under collections/
+DEFAULT_COLLECTION = "default"
+MAX_LOADED_COLLECTIONS = 8  # least recently searched shards are unloaded beyond this
+SEARCH_WORKERS = 4  # shards searched in parallel
+INDEX_MMAP = False  # memory-map index.bin instead of reading it into RAM
+CHUNK_DB = INDEX_DIR / "chunks.db"  # chunk text + metadata keyed by FAISS id (one per shard)
+CAPTION_CACHE = INDEX_DIR / "captions.db"  # image content hash → caption
+SEARCH_MODE = "hybrid"  # default search_documents mode: "hybrid", "dense" or "lexical"
+SEARCH_CANDIDATES = 20  # hits taken from each retriever before fusion
+RRF_K = 60  # reciprocal-rank fusion damping constant
+SEARCH_MIN_SIMILARITY = 0.4  # drop hits with a lower cosine similarity to the query (0 = keep all)...
+SEARCH_MIN_TERM_COVERAGE = 1.0  # ...unless the lexical index finds this share of the query's terms in them
+NO_RELEVANT_RESULTS = "NO_RELEVANT_RESULTS"  # prefix of a search result with no hit above the cutoff
+SNIPPETS = False  # default for search tools: best sentences of each hit instead of whole chunks
+SNIPPET_CHARS = 1500  # character budget for all snippets of one query
+SNIPPET_SENTENCES = 3  # best sentences kept per hit
+MMR_LAMBDA = 0.7  # snippet hit order: relevance to the query vs. novelty against hits already taken
+COMPACT_RATIO = 0.2  # compact index.bin once this share of its vectors are tombstoned
+INDEX_FACTORY = "Flat"  # document index encoding: Flat, SQ8, PQ32, IVF{nlist},PQ32 ({nlist} sized at rebuild)
+INDEX_REFINE = False  # also keep exact vectors (RFlat) and re-rank compressed candidates with them
+INDEX_REFINE_K_FACTOR = 4  # candidates re-ranked per requested hit
+INDEX_NPROBE = 16  # IVF lists probed per query
+CHECKPOINT_CHUNKS = 2000  # rewrite index.bin after this many new vectors...
+CHECKPOINT_SECONDS = 30  # ...or this long since the last checkpoint; the WAL covers the gap
+DEDUP_CHUNKS = True  # chunks repeated across documents share one vector
+DEDUP_SIMILARITY = 0.8  # near-duplicate: estimated Jaccard similarity of word 3-shingles
+MINHASH_PERMUTATIONS = 32
+MINHASH_BANDS = 8  # LSH bands of MINHASH_PERMUTATIONS // MINHASH_BANDS rows each
+DEDUP_NEAR_MIN_WORDS = 20  # shorter chunks are only merged on an exact match
+HASH_WORKERS = 8  # files hashed in parallel when their stat() fingerprint changed
+WATCH_DOCUMENTS = True  # re-index documents/ as files are added, changed or removed
+WATCH_DEBOUNCE_SECONDS = 2.0  # quiet period before a burst of changes is indexed
+WATCH_POLL_SECONDS = 5.0  # scan interval when native file events are unavailable
+
+
+def matryoshka(vectors: np.ndarray) -> np.ndarray:
+    """Keep the leading EMBED_DIM dimensions (nomic-embed-text v1.5 is Matryoshka-trained) and re-normalize."""
+    if not EMBED_DIM or vectors.shape[-1] <= EMBED_DIM:
+        return vectors
+    vectors = np.ascontiguousarray(vectors[..., :EMBED_DIM])
+    return vectors / (np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-12)
 
 
 def get_embedding(text: str) -> np.ndarray:
-    response = requests.post(EMBED_URL, json={"model": EMBED_MODEL, "prompt": text})
+    response = requests.post(EMBED_URL, json={"model": EMBED_MODEL, "input": text})
     response.raise_for_status()
-    return np.array(response.json()["embedding"], dtype=np.float32)
+    return matryoshka(np.array(response.json()["embeddings"][0], dtype=np.float32))
+
+
+async def embed_batches_async(texts: list[str], client: Optional[httpx.AsyncClient] = None) -> np.ndarray:
+    """Embed texts in EMBED_BATCH_SIZE batches over a pooled client, EMBED_CONCURRENCY at a time."""
+    if client is None:
+        limits = httpx.Limits(max_connections=EMBED_CONCURRENCY)
+        async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+            return await embed_batches_async(texts, client)
+
+    semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+    async def embed_batch(batch: list[str]) -> list:
+        async with semaphore:
+            for attempt in range(EMBED_RETRIES):
+                try:
+                    response = await client.post(EMBED_URL, json={"model": EMBED_MODEL, "input": batch})
+                    response.raise_for_status()
+                    return response.json()["embeddings"]
+                except (httpx.HTTPError, KeyError) as e:
+                    if attempt == EMBED_RETRIES - 1:
+                        raise
+                    mcp_log("WARN", f"Embedding batch failed ({e}), retry {attempt + 1}/{EMBED_RETRIES - 1}")
+                    await asyncio.sleep(2 ** attempt)
+
+    batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+    return matryoshka(np.array([vector for batch in results for vector in batch], dtype=np.float32))
+
+
+def run_sync(coro):
+    """Run a coroutine from sync code, even when called from inside a running event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+def get_embeddings(texts: list[str]) -> np.ndarray:
+    return run_sync(embed_batches_async(texts))
 
 def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
     words = text.split()
@@ -95,103 +210,961 @@ Just respond in one word (Yes or No), and do not provide any further explanation
 
 
 
+# === CHUNK STORE ===
+
+def open_chunk_store(path: Path = CHUNK_DB) -> sqlite3.Connection:
+    """SQLite table of chunks keyed by FAISS id, so search reads only its k hits."""
+    path.parent.mkdir(exist_ok=True)
+    conn = sqlite3.connect(str(path), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")  # readers never block the ingesting writer
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chunks (
+            id INTEGER PRIMARY KEY,
+            doc TEXT NOT NULL,
+            chunk_id TEXT NOT NULL,
+            chunk TEXT NOT NULL,
+            vector_id INTEGER
+        )""")
+    if "vector_id" not in {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}:
+        conn.execute("ALTER TABLE chunks ADD COLUMN vector_id INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS chunks_doc ON chunks(doc)")
+    conn.execute("CREATE INDEX IF NOT EXISTS chunks_vector ON chunks(vector_id)")
+    # Live FAISS vectors with the signatures used to find duplicate chunks; several chunk rows
+    # (same boilerplate in different documents) may point at one vector
+    conn.execute("CREATE TABLE IF NOT EXISTS vectors (id INTEGER PRIMARY KEY, hash TEXT NOT NULL, minhash BLOB NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS vectors_hash ON vectors(hash)")
+    # MinHash LSH buckets: near-duplicates very likely share at least one band key
+    conn.execute("CREATE TABLE IF NOT EXISTS vector_bands (band_key INTEGER NOT NULL, vector_id INTEGER NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS vector_bands_key ON vector_bands(band_key)")
+    conn.execute("CREATE INDEX IF NOT EXISTS vector_bands_vector ON vector_bands(vector_id)")
+    # Ids of vectors no chunk uses any more, still in index.bin until compaction
+    conn.execute("CREATE TABLE IF NOT EXISTS tombstones (id INTEGER PRIMARY KEY)")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+    # Indexed files: content hash plus the stat() fingerprint it was taken at, committed with the chunks
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS documents (
+            name TEXT PRIMARY KEY,
+            hash TEXT NOT NULL,
+            size INTEGER,
+            mtime_ns INTEGER,
+            inode INTEGER
+        )""")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(documents)")}
+    for column in ("size", "mtime_ns", "inode"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE documents ADD COLUMN {column} INTEGER")
+    # Vectors committed since the last index.bin checkpoint, replayed after a crash
+    conn.execute("CREATE TABLE IF NOT EXISTS index_wal (id INTEGER PRIMARY KEY, vector BLOB NOT NULL)")
+    create_lexical_index(conn)
+    migrate_metadata_json(conn, path.parent)
+    migrate_doc_cache_json(conn, path.parent)
+    migrate_vector_signatures(conn)
+    return conn
+
+
+def create_lexical_index(conn: sqlite3.Connection):
+    """FTS5 (BM25) index over chunk text, kept in step with the chunks table by triggers."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'").fetchone()
+    conn.executescript("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(chunk, content='chunks', content_rowid='id');
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+            INSERT INTO chunks_fts(rowid, chunk) VALUES (new.id, new.chunk);
+        END;
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+            INSERT INTO chunks_fts(chunks_fts, rowid, chunk) VALUES ('delete', old.id, old.chunk);
+        END;
+        CREATE TRIGGER IF NOT EXISTS chunks_fts_update AFTER UPDATE ON chunks BEGIN
+            INSERT INTO chunks_fts(chunks_fts, rowid, chunk) VALUES ('delete', old.id, old.chunk);
+            INSERT INTO chunks_fts(rowid, chunk) VALUES (new.id, new.chunk);
+        END;
+    """)
+    if not exists:
+        # Chunks stored before the lexical index existed
+        with conn:
+            conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')")
+
+
+def allocate_ids(conn: sqlite3.Connection, n: int) -> np.ndarray:
+    """Reserve n stable FAISS ids; ids are never reused, even after their chunks are deleted."""
+    row = conn.execute("SELECT value FROM meta WHERE key = 'next_id'").fetchone()
+    start = int(row[0]) if row else conn.execute("SELECT COALESCE(MAX(id), -1) + 1 FROM chunks").fetchone()[0]
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_id', ?)", (start + n,))
+    return np.arange(start, start + n, dtype=np.int64)
+
+
+def get_meta(conn: sqlite3.Connection, key: str, default=None):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_meta(conn: sqlite3.Connection, key: str, value):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def delete_document(conn: sqlite3.Connection, doc: str) -> list[int]:
+    """Delete a document's chunk rows; returns the vector id of each. Caller owns the transaction."""
+    vector_ids = [row[0] for row in conn.execute("SELECT vector_id FROM chunks WHERE doc = ?", (doc,))]
+    conn.execute("DELETE FROM chunks WHERE doc = ?", (doc,))
+    return vector_ids
+
+
+def release_vectors(conn: sqlite3.Connection, vector_ids: list[int]):
+    """Tombstone those vectors that no chunk row refers to any more."""
+    orphans = [
+        (vid,) for vid in set(vector_ids)
+        if conn.execute("SELECT 1 FROM chunks WHERE vector_id = ? LIMIT 1", (vid,)).fetchone() is None
+    ]
+    conn.executemany("INSERT OR IGNORE INTO tombstones (id) VALUES (?)", orphans)
+    conn.executemany("DELETE FROM vectors WHERE id = ?", orphans)
+    conn.executemany("DELETE FROM vector_bands WHERE vector_id = ?", orphans)
+
+
+def tombstone_document(conn: sqlite3.Connection, doc: str) -> int:
+    """Delete a document's chunk rows and tombstone vectors only it used. Caller owns the transaction."""
+    vector_ids = delete_document(conn, doc)
+    release_vectors(conn, vector_ids)
+    return len(vector_ids)
+
+
+_minhash_rng = np.random.default_rng(0)  # fixed: signatures are stored and compared across runs
+MINHASH_A = _minhash_rng.integers(1, 2**63, size=MINHASH_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+MINHASH_B = _minhash_rng.integers(0, 2**63, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def exact_key(words: list[str]) -> str:
+    return hashlib.blake2b(" ".join(words).encode(), digest_size=16).hexdigest()
+
+
+def chunk_signature(text: str) -> tuple[str, np.ndarray, int]:
+    """Exact key (BLAKE2 of the normalized words), MinHash of word 3-shingles, word count."""
+    words = re.findall(r"\w+", text.lower())
+    exact = exact_key(words)
+    shingles = {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") for s in shingles],
+        dtype=np.uint64
+    )
+    # Multiply-shift hashing, one row per permutation; uint64 overflow wraps by design
+    with np.errstate(over="ignore"):
+        permuted = (MINHASH_A[:, None] * hashes[None, :] + MINHASH_B[:, None]) >> np.uint64(32)
+    return exact, permuted.min(axis=1).astype(np.uint32), len(words)
+
+
+def band_keys(minhash: np.ndarray) -> list[int]:
+    rows = MINHASH_PERMUTATIONS // MINHASH_BANDS
+    return [
+        int.from_bytes(hashlib.blake2b(bytes([b]) + minhash[b * rows:(b + 1) * rows].tobytes(), digest_size=8).digest(), "little") >> 1
+        for b in range(MINHASH_BANDS)
+    ]
+
+
+def store_signature(conn: sqlite3.Connection, vector_id: int, exact: str, minhash: np.ndarray):
+    conn.execute("INSERT OR IGNORE INTO vectors (id, hash, minhash) VALUES (?, ?, ?)", (vector_id, exact, minhash.tobytes()))
+    conn.executemany(
+        "INSERT INTO vector_bands (band_key, vector_id) VALUES (?, ?)", [(key, vector_id) for key in band_keys(minhash)]
+    )
+
+
+def find_duplicate(conn: sqlite3.Connection, exact: str, minhash: np.ndarray, words: int) -> Optional[int]:
+    """Vector id of a live chunk with the same or nearly the same text, if any."""
+    row = conn.execute("SELECT id FROM vectors WHERE hash = ? LIMIT 1", (exact,)).fetchone()
+    if row:
+        return row[0]
+    if words < DEDUP_NEAR_MIN_WORDS:
+        return None
+    keys = band_keys(minhash)
+    candidates = conn.execute(
+        f"""SELECT DISTINCT v.id, v.minhash FROM vector_bands b JOIN vectors v ON v.id = b.vector_id
+            WHERE b.band_key IN ({','.join('?' * len(keys))})""", keys
+    ).fetchall()
+    for vid, other in candidates:
+        # Share of equal MinHash slots estimates the shingle Jaccard similarity
+        if np.mean(np.frombuffer(other, dtype=np.uint32) == minhash) >= DEDUP_SIMILARITY:
+            return vid
+    return None
+
+
+def migrate_vector_signatures(conn: sqlite3.Connection):
+    """One-time: chunks stored before deduplication each own their vector; record its signature."""
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'vector_signatures'").fetchone():
+        return
+    with conn:
+        conn.execute("UPDATE chunks SET vector_id = id WHERE vector_id IS NULL")
+        rows = conn.execute(
+            "SELECT vector_id, chunk FROM chunks WHERE vector_id NOT IN (SELECT id FROM vectors)"
+        ).fetchall()
+        for vid, chunk in rows:
+            store_signature(conn, vid, *chunk_signature(chunk)[:2])
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('vector_signatures', 1)")
+
+
+def migrate_metadata_json(conn: sqlite3.Connection, shard: Path):
+    """One-time import of the legacy metadata.json list (list position == FAISS id)."""
+    legacy = shard / "metadata.json"
+    if not legacy.exists():
+        return
+    if conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0] == 0:
+        rows = json.loads(legacy.read_text())
+        with conn:
+            conn.executemany(
+                "INSERT INTO chunks (id, doc, chunk_id, chunk) VALUES (?, ?, ?, ?)",
+                [(i, r["doc"], r["chunk_id"], r["chunk"]) for i, r in enumerate(rows)]
+            )
+        mcp_log("INFO", f"Migrated {len(rows)} chunks from metadata.json to {CHUNK_DB.name}")
+    legacy.rename(legacy.with_suffix(".json.migrated"))
+
+
+def migrate_doc_cache_json(conn: sqlite3.Connection, shard: Path):
+    """One-time import of the legacy doc_index_cache.json (file name → hash)."""
+    legacy = shard / "doc_index_cache.json"
+    if not legacy.exists():
+        return
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO documents (name, hash) VALUES (?, ?)",
+            json.loads(legacy.read_text()).items()
+        )
+    legacy.rename(legacy.with_suffix(".json.migrated"))
+
+
+_reader = threading.local()
+
+
+def chunk_reader(db_path: Path = CHUNK_DB) -> sqlite3.Connection:
+    # One read connection per thread and shard; SQLite connections are not shared across threads
+    conns = _reader.__dict__.setdefault("conns", {})
+    conn = conns.get(db_path)
+    if conn is None:
+        conn = conns[db_path] = open_chunk_store(db_path)
+    return conn
+
+
+def fetch_chunks(ids, db_path: Path = CHUNK_DB) -> dict[int, dict]:
+    """Chunk for each chunk row id; "sources" lists every document holding exactly the same text."""
+    ids = [int(i) for i in ids if i >= 0]
+    if not ids:
+        return {}
+    conn = chunk_reader(db_path)
+    rows = conn.execute(
+        f"SELECT id, doc, chunk_id, chunk, vector_id FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids
+    ).fetchall()
+    # Exact duplicates always share a vector; near-duplicates under it have their own text and stay apart
+    vids = list({row[4] for row in rows})
+    sources: dict[tuple[int, str], list[str]] = {}
+    for vid, doc, chunk in conn.execute(
+        f"SELECT vector_id, doc, chunk FROM chunks WHERE vector_id IN ({','.join('?' * len(vids))}) ORDER BY id", vids
+    ):
+        docs = sources.setdefault((vid, exact_key(re.findall(r"\w+", chunk.lower()))), [])
+        if doc not in docs:
+            docs.append(doc)
+    chunks = {}
+    for row_id, doc, chunk_id, chunk, vid in rows:
+        key = exact_key(re.findall(r"\w+", chunk.lower()))
+        chunks[row_id] = {
+            "doc": doc, "chunk_id": chunk_id, "chunk": chunk, "hash": key, "sources": list(sources.get((vid, key), [doc]))
+        }
+    return chunks
+
+
+def representative_rows(vector_ids: list[int], db_path: Path = CHUNK_DB) -> dict[int, int]:
+    """Oldest chunk row of each vector; what a dense hit shows when no lexical match picks a row."""
+    if not vector_ids:
+        return {}
+    return dict(chunk_reader(db_path).execute(
+        f"SELECT vector_id, MIN(id) FROM chunks WHERE vector_id IN ({','.join('?' * len(vector_ids))}) GROUP BY vector_id",
+        vector_ids
+    ).fetchall())
+
+
+# === RESIDENT INDEX ===
+
+def inner_index(index):
+    return faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+
+
+def supports_selector(index) -> bool:
+    # IndexPQ rejects search-time selectors and IndexRefine silently ignores them
+    return not isinstance(index, (faiss.IndexRefine, faiss.IndexPQ))
+
+
+class IndexSnapshot:
+    """Loaded index; replaced as a whole, never mutated, at every checkpoint."""
+
+    def __init__(self, index, generation: int, tombstones: np.ndarray):
+        self.index = index
+        self.generation = generation
+        self.tombstones = tombstones
+        inner = inner_index(index)
+        # Skip tombstoned vectors inside FAISS so k stays filled before compaction; index types
+        # that can't take a selector over-fetch and drop them afterwards instead
+        self.post_filter = set(tombstones.tolist()) if len(tombstones) and not supports_selector(inner) else None
+        self._live = None
+        if len(tombstones) and self.post_filter is None:
+            self._dead = faiss.IDSelectorBatch(tombstones)
+            self._live = faiss.IDSelectorNot(self._dead)
+        self.params = search_params(inner, self._live, nprobe=INDEX_NPROBE, k_factor=INDEX_REFINE_K_FACTOR)
+
+
+# === COLLECTIONS ===
+
+def collection_docs(collection: str) -> Path:
+    return DOC_DIR if collection == DEFAULT_COLLECTION else DOC_DIR / collection
+
+
+def collection_chunker(collection: str) -> str:
+    return COLLECTION_CHUNKERS.get(collection, CHUNKER)
+
+
+def shard_dir(collection: str) -> Path:
+    return INDEX_DIR if collection == DEFAULT_COLLECTION else INDEX_DIR / "collections" / collection
+
+
+def is_collection_name(name: str) -> bool:
+    # images/ holds extracted PDF images; "default" would collide with the top-level files
+    return name not in ("images", DEFAULT_COLLECTION) and not name.startswith(".")
+
+
+def is_collection_dir(path: Path) -> bool:
+    return path.is_dir() and is_collection_name(path.name)
+
+
+def collection_names() -> list[str]:
+    """Collections with documents or an index on disk (an emptied folder still needs its deletions indexed)."""
+    names = {DEFAULT_COLLECTION}
+    if DOC_DIR.exists():
+        names |= {d.name for d in DOC_DIR.iterdir() if is_collection_dir(d)}
+    if (INDEX_DIR / "collections").exists():
+        names |= {d.name for d in (INDEX_DIR / "collections").iterdir() if d.is_dir()}
+    return sorted(names)
+
+
+def split_collection(relative: str) -> tuple[str, str]:
+    """"report.pdf" → (default, report.pdf); "finance/report.pdf" → (finance, report.pdf)."""
+    parts = Path(relative).parts
+    return (parts[0], parts[1]) if len(parts) == 2 else (DEFAULT_COLLECTION, parts[0])
+
+
+class Shard:
+    """One collection's index.bin + chunks.db; its snapshot is loaded on first search and may be unloaded."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.index_path = shard_dir(name) / "index.bin"
+        self.db_path = shard_dir(name) / "chunks.db"
+        self.snapshot: Optional[IndexSnapshot] = None
+        self.generation = 0
+        self.last_used = 0.0
+
+    def display(self, doc: str) -> str:
+        # Path relative to documents/, so hits from different collections stay distinguishable
+        return doc if self.name == DEFAULT_COLLECTION else f"{self.name}/{doc}"
+
+
+_shards: dict[str, Shard] = {}
+_snapshot_lock = threading.Lock()
+_search_pool = concurrent.futures.ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="shard-search")
+
+
+def get_shard(name: str = DEFAULT_COLLECTION) -> Shard:
+    shard = _shards.get(name)
+    if shard is None:
+        shard = _shards.setdefault(name, Shard(name))
+    return shard
+
+
+def read_faiss_index(path: Path):
+    if INDEX_MMAP:
+        try:
+            return faiss.read_index(str(path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            mcp_log("WARN", f"mmap not supported for {path.name}, loading into memory: {e}")
+    return faiss.read_index(str(path))
+
+
+def publish_snapshot(shard: Shard) -> Optional[IndexSnapshot]:
+    """Load the shard's checkpointed index.bin and swap it in; called by the writer after each checkpoint."""
+    with _snapshot_lock:
+        try:
+            index = read_faiss_index(shard.index_path)
+            tombstones = np.array(
+                [row[0] for row in chunk_reader(shard.db_path).execute("SELECT id FROM tombstones")], dtype=np.int64
+            )
+        except Exception as e:
+            mcp_log("WARN", f"Index reload failed for {shard.name}, keeping generation {shard.generation}: {e}")
+            return shard.snapshot
+
+        # Chunk rows are committed before index.bin is replaced, so every id in it resolves
+        shard.generation += 1
+        shard.snapshot = IndexSnapshot(index, shard.generation, tombstones)
+        mcp_log("INFO", f"Published {shard.name} generation {shard.generation} ({index.ntotal} vectors)")
+        return shard.snapshot
+
+
+def refresh_snapshot(shard: Shard):
+    """After a write: republish if searches have this shard loaded; otherwise the next load reads it."""
+    if shard.snapshot is not None:
+        publish_snapshot(shard)
+
+
+def unload_shard(shard: Shard):
+    # In-flight searches keep their reference; the index is freed when they finish
+    if shard.snapshot is not None:
+        shard.snapshot = None
+        mcp_log("INFO", f"Unloaded collection {shard.name}")
+
+
+def current_snapshot(shard: Optional[Shard] = None) -> Optional[IndexSnapshot]:
+    """Latest published snapshot; a plain reference read, searches never wait on the writer."""
+    shard = shard or get_shard()
+    shard.last_used = time.monotonic()
+    snapshot = shard.snapshot
+    if snapshot is None and shard.index_path.exists():
+        snapshot = publish_snapshot(shard)
+        loaded = sorted((s for s in _shards.values() if s.snapshot is not None), key=lambda s: s.last_used)
+        for stale in loaded[:max(0, len(loaded) - MAX_LOADED_COLLECTIONS)]:
+            unload_shard(stale)
+    return snapshot
+
+
+def fsync_replace(tmp: Path, path: Path):
+    """Flush tmp to disk, then rename it over path, so a crash leaves the old or new file, never half of one."""
+    fd = os.open(tmp, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
+    if os.name != "nt":  # persist the rename itself; directories can't be opened on Windows
+        fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def write_index_atomic(index, path: Path):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    faiss.write_index(index, str(tmp))
+    fsync_replace(tmp, path)
+
+
+# === RETRIEVAL ===
+
+def dense_search(snapshot: IndexSnapshot, query_vecs: np.ndarray, k: int) -> list[list[tuple[float, int]]]:
+    """One index.search over the whole query matrix; (distance, id) hits per query row."""
+    dead = snapshot.post_filter
+    fetch = min(k + len(dead), 4 * k) if dead else k
+    D, I = snapshot.index.search(query_vecs, k=fetch, params=snapshot.params)
+    return [
+        [(float(d), int(i)) for d, i in zip(row_d, row_i) if i >= 0 and not (dead and int(i) in dead)][:k]
+        for row_d, row_i in zip(D, I)
+    ]
+
+
+def lexical_search(query: str, k: int, db_path: Path = CHUNK_DB) -> list[tuple[float, int, int, float]]:
+    """BM25 ranking from the FTS5 index; exact tokens such as invoice numbers and names.
+
+    Hits are (bm25, chunk row id, vector id, share of the query's terms the chunk contains).
+    Rows, not vectors: near-duplicate chunks share a vector but differ in exactly such tokens.
+    """
+    terms = list(dict.fromkeys(re.findall(r"\w+", query.lower())))
+    if not terms:
+        return []
+    conn = chunk_reader(db_path)
+    rows = conn.execute(
+        """SELECT bm25(chunks_fts), c.id, c.vector_id FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid
+           WHERE chunks_fts MATCH ? ORDER BY bm25(chunks_fts) LIMIT ?""", (" OR ".join(f'"{term}"' for term in terms), k)
+    ).fetchall()
+    if not rows:
+        return []
+    # BM25 magnitudes depend on corpus statistics (a term in half the chunks scores ~0), so
+    # relevance is judged by which terms matched, with the index's own tokenizer
+    ids = [row[1] for row in rows]
+    matched = dict.fromkeys(ids, 0)
+    for term in terms:
+        for (row_id,) in conn.execute(
+            f"SELECT rowid FROM chunks_fts WHERE chunks_fts MATCH ? AND rowid IN ({','.join('?' * len(ids))})",
+            (f'"{term}"', *ids)
+        ):
+            matched[row_id] += 1
+    return [(score, row_id, vid, matched[row_id] / len(terms)) for score, row_id, vid in rows]
+
+
+def rrf_fuse(rankings: list[list], k: int) -> list[tuple]:
+    """Reciprocal-rank fusion: score(id) = sum over rankings of 1 / (RRF_K + rank); best k (id, score) pairs."""
+    scores: dict = {}
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking):
+            scores[idx] = scores.get(idx, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def embed_queries(queries: list[str]) -> np.ndarray:
+    return get_embedding(queries[0]).reshape(1, -1) if len(queries) == 1 else get_embeddings(queries)
+
+
+def l2_similarity(distance: float) -> float:
+    # Embeddings are unit length, so squared L2 distance d = 2 - 2·cos
+    return 1.0 - distance / 2.0
+
+
+def stored_similarity(snapshot: IndexSnapshot, query_vec: np.ndarray, vector_ids: list[int]) -> dict[int, float]:
+    """Similarity of vectors the dense search didn't return (lexical-only hits); skipped where unrecoverable."""
+    similarities = {}
+    for vid in vector_ids:
+        try:
+            vector = snapshot.index.reconstruct(vid)
+        except RuntimeError:  # e.g. IVF without a direct map
+            continue
+        similarities[vid] = l2_similarity(float(np.sum((vector - query_vec) ** 2)))
+    return similarities
+
+
+def search_chunk_ids(
+    shards: list[Shard], queries: list[str], k: int, mode: str = SEARCH_MODE,
+    query_vecs: Optional[np.ndarray] = None
+) -> list[list[tuple[tuple[str, int], dict]]]:
+    """Fan out to every shard on the search pool, merge per-retriever rankings, fuse.
+
+    Returns one ranking per query of ((collection, chunk row id), scores) pairs; scores holds the
+    ranking "score" (RRF, similarity or BM25 by mode), the cosine "similarity" when known and
+    the "bm25" match strength and "term_coverage" when the lexical index matched. All queries share one embedding
+    request and one index.search per shard.
+    """
+    n = SEARCH_CANDIDATES if mode == "hybrid" else k
+    if mode == "lexical":
+        query_vecs = None
+    elif query_vecs is None:
+        query_vecs = embed_queries(queries)
+    empty = [[] for _ in queries]
+
+    def search_shard(shard: Shard):
+        snapshot = current_snapshot(shard)
+        # A shard still re-embedding after an EMBED_DIM change serves lexical hits only
+        usable = query_vecs is not None and snapshot is not None and snapshot.index.d == query_vecs.shape[1]
+        dense = dense_search(snapshot, query_vecs, n) if usable else empty
+        lexical = [lexical_search(q, n, shard.db_path) for q in queries] if mode != "dense" and shard.db_path.exists() else empty
+        similarity = [{vid: l2_similarity(d) for d, vid in hits} for hits in dense]
+        if usable and mode == "hybrid":
+            for q, hits in enumerate(lexical):
+                missing = [vid for _, _, vid, _ in hits if vid not in similarity[q]]
+                similarity[q].update(stored_similarity(snapshot, query_vecs[q], missing))
+        # A dense hit is shown as the vector's best lexical row for that query, else its oldest row
+        oldest = representative_rows(list({vid for hits in dense for _, vid in hits}), shard.db_path) if usable else {}
+        dense_rows = []
+        for hits, matched in zip(dense, lexical):
+            best = {}
+            for _, row, vid, _ in matched:
+                best.setdefault(vid, row)
+            dense_rows.append([(d, best.get(vid, oldest.get(vid)), vid) for d, vid in hits if vid in best or vid in oldest])
+        return (
+            [[(d, (shard.name, row)) for d, row, _ in hits] for hits in dense_rows],
+            [[(b, (shard.name, row), coverage) for b, row, _, coverage in hits] for hits in lexical],
+            [
+                {(shard.name, row): sims[vid] for hits in (rows, matched) for _, row, vid, *_ in hits if vid in sims}
+                for rows, matched, sims in zip(dense_rows, lexical, similarity)
+            ] if usable else [{} for _ in queries],
+        )
+
+    results = list(_search_pool.map(search_shard, shards)) if len(shards) > 1 else [search_shard(s) for s in shards]
+    rankings = []
+    for q in range(len(queries)):
+        # L2 distances share one embedding space; BM25 scores are per-shard statistics, close enough to interleave
+        dense = [key for _, key in sorted((hit for r in results for hit in r[0][q]), key=lambda h: h[0])][:n]
+        lexical_hits = sorted((hit for r in results for hit in r[1][q]), key=lambda h: h[0])[:n]
+        lexical = [key for _, key, _ in lexical_hits]
+        bm25 = {key: -score for score, key, _ in lexical_hits}  # FTS5 bm25() is negative, lower is better
+        coverage = {key: share for _, key, share in lexical_hits}
+        similarity = {key: sim for r in results for key, sim in r[2][q].items()}
+
+        if mode == "dense":
+            ranked = [(key, similarity[key]) for key in dense[:k]]
+        elif mode == "lexical":
+            ranked = [(key, bm25[key]) for key in lexical[:k]]
+        else:
+            ranked = rrf_fuse([dense, lexical], k)
+        rankings.append([
+            (key, {"score": score, "similarity": similarity.get(key), "bm25": bm25.get(key), "term_coverage": coverage.get(key)})
+            for key, score in ranked
+        ])
+    return rankings
+
+
+def above_cutoff(ranking: list[tuple[tuple[str, int], dict]], min_similarity: float) -> list:
+    """Drop hits known to be less similar to the query than min_similarity; unscored ones stay.
+
+    A hit either retriever vouches for stays: exact-entity queries (an invoice number, a name)
+    often embed far from the chunk that contains them, so hits holding SEARCH_MIN_TERM_COVERAGE
+    of the query's terms pass whatever their cosine similarity.
+    """
+    if not min_similarity:
+        return ranking
+    return [
+        (key, scores) for key, scores in ranking
+        if scores["similarity"] is None or scores["similarity"] >= min_similarity
+        or (scores["term_coverage"] or 0) >= SEARCH_MIN_TERM_COVERAGE
+    ]
+
+
+def fetch_hits(keys: list[tuple[str, int]]) -> dict[tuple[str, int], dict]:
+    """fetch_chunks across shards; docs are shown relative to documents/."""
+    by_shard: dict[str, list[int]] = {}
+    for name, row in keys:
+        by_shard.setdefault(name, []).append(row)
+    hits = {}
+    for name, ids in by_shard.items():
+        shard = get_shard(name)
+        for row, data in fetch_chunks(ids, shard.db_path).items():
+            data["doc"] = shard.display(data["doc"])
+            data["sources"] = [shard.display(doc) for doc in data["sources"]]
+            data["collection"] = name
+            hits[(name, row)] = data
+    return hits
+
+
+def resolve_collections(collection: Optional[str]) -> list[Shard]:
+    """Shards to search: the named collection(s), comma separated, or all of them."""
+    names = collection_names()
+    if not collection:
+        return [get_shard(name) for name in names]
+    wanted = [name.strip() for name in collection.split(",") if name.strip()]
+    unknown = [name for name in wanted if name not in names]
+    if unknown:
+        raise ValueError(f"Unknown collection(s): {', '.join(unknown)}; available: {', '.join(names)}")
+    return [get_shard(name) for name in wanted]
+
+
+def merge_hits(ranking: list, chunks: dict) -> list[dict]:
+    """Hits in rank order, one per distinct text; exact duplicates under other keys add their sources.
+
+    Near-duplicates (same vector, different text) stay separate hits: the words that differ,
+    such as an invoice number, are usually what the query was after.
+    """
+    hits, by_hash = [], {}
+    for key, scores in ranking:
+        data = chunks.get(key)
+        if data is None:
+            continue
+        first = by_hash.get(data["hash"])
+        if first is not None:
+            first["sources"] += [doc for doc in data["sources"] if doc not in first["sources"]]
+            continue
+        hit = {**data, **scores, "sources": list(data["sources"]), "start": 0, "end": len(data["chunk"])}
+        hits.append(hit)
+        by_hash[data["hash"]] = hit
+    return hits
+
+
+def unit_rows(vectors: np.ndarray) -> np.ndarray:
+    return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+
+
+def extract_snippets(query_vec: np.ndarray, hits: list[dict], budget: int = SNIPPET_CHARS) -> list[dict]:
+    """Cut hits down to their best sentences within a character budget, in MMR order.
+
+    Every sentence of every hit is embedded in one request and scored by cosine similarity to
+    the query; a hit's vector is the mean of its sentences. Hits are taken greedily by
+    MMR_LAMBDA * relevance - (1 - MMR_LAMBDA) * similarity to hits already taken, so a second
+    chunk saying the same thing drops behind one that adds something new.
+    """
+    sentences = [split_sentences(hit["chunk"]) or [hit["chunk"]] for hit in hits]
+    flat = [sentence for group in sentences for sentence in group]
+    if not flat:
+        return hits
+    vectors = unit_rows(get_embeddings(flat))
+    scores = vectors @ (query_vec / (np.linalg.norm(query_vec) + 1e-12))
+    bounds = np.cumsum([0] + [len(group) for group in sentences])
+    hit_vecs = unit_rows(np.add.reduceat(vectors, bounds[:-1], axis=0))
+    relevance = hit_vecs @ (query_vec / (np.linalg.norm(query_vec) + 1e-12))
+    similarity = hit_vecs @ hit_vecs.T
+
+    order, redundancy = [], np.zeros(len(hits))
+    remaining = list(range(len(hits)))
+    while remaining:
+        mmr = MMR_LAMBDA * relevance[remaining] - (1 - MMR_LAMBDA) * redundancy[remaining]
+        best = remaining.pop(int(np.argmax(mmr)))
+        order.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+
+    results = []
+    for h in order:
+        if budget <= 0:
+            break
+        group, group_scores = sentences[h], scores[bounds[h]:bounds[h + 1]]
+        keep = []
+        for s in np.argsort(-group_scores)[:SNIPPET_SENTENCES]:
+            if len(group[s]) > budget and keep:
+                continue
+            keep.append(s)
+            budget -= len(group[s])
+        keep.sort()  # best sentences, read in document order
+        snippet = " … ".join(group[s] for s in keep)
+        if budget < 0:  # a single sentence longer than what was left
+            snippet = snippet[:len(snippet) + budget].rstrip() + "…"
+        # Character span of the kept sentences within the stored chunk
+        chunk = hits[h]["chunk"]
+        start = max(chunk.find(group[keep[0]]), 0)
+        end = chunk.find(group[keep[-1]], start)
+        end = end + len(group[keep[-1]]) if end >= 0 else len(chunk)
+        results.append({**hits[h], "chunk": snippet, "start": start, "end": end})
+    return results
+
+
+@mcp.tool()
+def list_collections() -> list[str]:
+    """List document collections (folders under documents/) that search_documents can be limited to. Usage: list_collections"""
+    lines = []
+    for name in collection_names():
+        shard = get_shard(name)
+        if not shard.db_path.exists():
+            lines.append(f"{name}: not indexed yet")
+            continue
+        conn = chunk_reader(shard.db_path)
+        docs = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        chunks = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        lines.append(f"{name}: {docs} documents, {chunks} chunks{' (loaded)' if shard.snapshot else ''}")
+    return lines
+
+
+def format_hit(hit: dict) -> str:
+    also = [doc for doc in hit["sources"] if doc != hit["doc"]]
+    note = f"; also in: {', '.join(also)}" if also else ""
+    score = f", similarity {hit['similarity']:.2f}" if hit.get("similarity") is not None else ""
+    return f"{hit['chunk']}\n[Source: {hit['doc']}, ID: {hit['chunk_id']}{score}{note}]"
+
+
+def no_relevant_results(query: str, min_similarity: float) -> str:
+    # Fixed prefix so the agent loop can reroute without reading anything else
+    cutoff = f" above similarity {min_similarity} or by all its terms" if min_similarity else ""
+    return f"{NO_RELEVANT_RESULTS}: nothing in the indexed documents matches \"{query}\"{cutoff}"
+
+
+def run_search(
+    queries: list[str], mode: str, collection: Optional[str], snippets: bool, min_similarity: float, k: int = 5
+) -> list[list[dict]]:
+    """Hits per query, best first, cut off at min_similarity; raises ValueError for bad arguments or no index."""
+    if mode not in ("hybrid", "dense", "lexical"):
+        raise ValueError(f"Unknown search mode: {mode}")
+    shards = resolve_collections(collection)
+    if not any(shard.index_path.exists() or shard.db_path.exists() for shard in shards):
+        status = _index_status
+        raise ValueError(
+            f"Document index is not available yet ({status['state']}, "
+            f"{status['files_done']}/{status['files_total']} files); try again shortly"
+        )
+
+    query_vecs = embed_queries(queries) if snippets or mode != "lexical" else None
+    rankings = [above_cutoff(ranking, min_similarity) for ranking in search_chunk_ids(shards, queries, k, mode, query_vecs)]
+    chunks = fetch_hits([key for ranking in rankings for key, _ in ranking])  # one lookup per shard for all queries
+    results = []
+    for q, ranking in enumerate(rankings):
+        hits = merge_hits(ranking, chunks)
+        if snippets and hits:
+            hits = extract_snippets(query_vecs[q], hits)
+        results.append(hits)
+    return results
+
+
 @mcp.tool()
-def search_documents(query: str) -> list[str]:
-    """Search indexed documents for relevant content. Usage: search_documents|query="india Current GDP" """
-    ensure_faiss_ready()
-    mcp_log("SEARCH", f"Query: {query}")
+def search_documents(
+    query: str, mode: str = SEARCH_MODE, collection: Optional[str] = None, snippets: bool = SNIPPETS,
+    min_similarity: float = SEARCH_MIN_SIMILARITY
+) -> list[str]:
+    """Search indexed documents for relevant content; mode is hybrid (default), dense or lexical; collection limits the search to one or more comma-separated collections (see list_collections); snippets=true returns only the most relevant sentences of each hit; hits below min_similarity are dropped unless they contain every query term, and NO_RELEVANT_RESULTS is returned when none is left. Usage: search_documents|query="india Current GDP" """
+    mcp_log("SEARCH", f"Query: {query} ({mode}{', ' + collection if collection else ''})")
     try:
-        index = faiss.read_index(str(ROOT / "faiss_index" / "index.bin"))
-        metadata = json.loads((ROOT / "faiss_index" / "metadata.json").read_text())
-        query_vec = get_embedding(query).reshape(1, -1)
-        D, I = index.search(query_vec, k=5)
-        results = []
-        for idx in I[0]:
-            data = metadata[idx]
-            results.append(f"{data['chunk']}\n[Source: {data['doc']}, ID: {data['chunk_id']}]")
-        return results
+        hits = run_search([query], mode, collection, snippets, min_similarity)[0]
+        if not hits:
+            return [no_relevant_results(query, min_similarity)]
+        return [format_hit(hit) for hit in hits]
+    except ValueError as e:
+        return [f"ERROR: {e}"]
     except Exception as e:
         return [f"ERROR: Failed to search: {str(e)}"]
 
 
-def caption_image(img_url_or_path: str) -> str:
-    mcp_log("CAPTION", f"🖼️ Attempting to caption image: {img_url_or_path}")
-
-    full_path = Path(__file__).parent / "documents" / img_url_or_path
-    full_path = full_path.resolve()
+@mcp.tool()
+def search_documents_structured(
+    query: str, mode: str = SEARCH_MODE, collection: Optional[str] = None, snippets: bool = SNIPPETS,
+    min_similarity: float = SEARCH_MIN_SIMILARITY
+) -> SearchDocumentsOutput:
+    """Same search as search_documents, returned as data: relevant=false when no hit passes min_similarity or contains every query term, else hits with text, doc, chunk_id, character offsets within the chunk, similarity, bm25, term coverage and fused score. Usage: search_documents_structured|query="DLF revenue 2023" """
+    mcp_log("SEARCH", f"Structured query: {query} ({mode}{', ' + collection if collection else ''})")
+    hits = run_search([query], mode, collection, snippets, min_similarity)[0]
+    return SearchDocumentsOutput(
+        query=query,
+        relevant=bool(hits),
+        hits=[
+            SearchHit(
+                text=hit["chunk"], doc=hit["doc"], chunk_id=hit["chunk_id"], collection=hit["collection"],
+                start=hit["start"], end=hit["end"], score=hit["score"], similarity=hit["similarity"],
+                bm25=hit["bm25"], term_coverage=hit["term_coverage"], sources=hit["sources"]
+            )
+            for hit in hits
+        ],
+    )
 
-    if not full_path.exists():
-        mcp_log("ERROR", f"❌ Image file not found: {full_path}")
-        return f"[Image file not found: {img_url_or_path}]"
 
+@mcp.tool()
+def search_documents_batch(
+    queries: list[str], mode: str = SEARCH_MODE, collection: Optional[str] = None, snippets: bool = SNIPPETS,
+    min_similarity: float = SEARCH_MIN_SIMILARITY
+) -> list[str]:
+    """Search several related queries at once (e.g. one per entity); returns one block per query, and a chunk already shown for an earlier query is only referenced; snippets=true returns only the most relevant sentences of each hit. Usage: search_documents_batch|queries=["DLF revenue", "DLF debt"]"""
+    queries = [q for q in dict.fromkeys(q.strip() for q in queries) if q]
+    mcp_log("SEARCH", f"Batch of {len(queries)} queries ({mode}{', ' + collection if collection else ''})")
+    if not queries:
+        return ["ERROR: No queries given"]
     try:
-        if img_url_or_path.startswith("http"): # for extract_web_pages
-            response = requests.get(img_url_or_path)
-            encoded_image = base64.b64encode(response.content).decode("utf-8")
-        else:
-            with open(full_path, "rb") as img_file:
-                encoded_image = base64.b64encode(img_file.read()).decode("utf-8")
-
-        # Set stream=True to get the full generator-style output
-        with requests.post(OLLAMA_URL, json={
-            "model": GEMMA_MODEL,
-            "prompt": "If there is lot of text in the image, then ONLY reply back with exact text in the image, else Describe the image such that your response can replace 'alt-text' for it. Only explain the contents of the image and provide no further explaination.",
-            "images": [encoded_image],
-            "stream": True
-        }, stream=True) as response:
-
-            caption_parts = []
-            for line in response.iter_lines():
-                if not line:
+        results = run_search(queries, mode, collection, snippets, min_similarity)
+        shown: dict[str, int] = {}  # text hash (or chunk id) → query number it was printed under
+        blocks = []
+        for number, (query, hits) in enumerate(zip(queries, results), start=1):
+            lines = []
+            for hit in hits:
+                seen = hit["hash"] or hit["chunk_id"]
+                if seen in shown:
+                    lines.append(f"[Source: {hit['doc']}, ID: {hit['chunk_id']}; shown under query {shown[seen]}]")
                     continue
-                try:
-                    data = json.loads(line)
-                    caption_parts.append(data.get("response", ""))
-                    if data.get("done", False):
-                        break
-                except json.JSONDecodeError:
-                    continue  # silently skip malformed lines
-
-            caption = "".join(caption_parts).strip()
-            mcp_log("CAPTION", f"✅ Caption generated: {caption}")
-            return caption if caption else "[No caption returned]"
-
+                shown[seen] = number
+                lines.append(format_hit(hit))
+            body = "\n\n".join(lines) if lines else no_relevant_results(query, min_similarity)
+            blocks.append(f"## Query {number}: {query}\n\n{body}")
+        return blocks
+    except ValueError as e:
+        return [f"ERROR: {e}"]
     except Exception as e:
-        mcp_log("ERROR", f"⚠️ Failed to caption image {img_url_or_path}: {e}")
-        return f"[Image could not be processed: {img_url_or_path}]"
+        return [f"ERROR: Failed to search: {str(e)}"]
+
+
+CAPTION_PROMPT = "If there is lot of text in the image, then ONLY reply back with exact text in the image, else Describe the image such that your response can replace 'alt-text' for it. Only explain the contents of the image and provide no further explaination."
 
 
+def open_caption_cache() -> sqlite3.Connection:
+    """Persistent captions keyed by image content hash, shared across pages and documents."""
+    CAPTION_CACHE.parent.mkdir(exist_ok=True)
+    conn = sqlite3.connect(str(CAPTION_CACHE), timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS captions (hash TEXT PRIMARY KEY, caption TEXT NOT NULL)")
+    return conn
 
 
+def load_image_bytes(img_url_or_path: str) -> bytes:
+    if img_url_or_path.startswith("http"): # for extract_web_pages
+        response = requests.get(img_url_or_path, timeout=30)
+        response.raise_for_status()
+        return response.content
+    full_path = (Path(__file__).parent / "documents" / img_url_or_path).resolve()
+    return full_path.read_bytes()
+
+
+def generate_caption(image: bytes) -> str:
+    """Stream a gemma3 caption for raw image bytes; raises on transport errors."""
+    encoded_image = base64.b64encode(image).decode("utf-8")
+
+    # Set stream=True to get the full generator-style output
+    with requests.post(OLLAMA_URL, json={
+        "model": GEMMA_MODEL,
+        "prompt": CAPTION_PROMPT,
+        "images": [encoded_image],
+        "stream": True
+    }, stream=True) as response:
+        response.raise_for_status()
+
+        caption_parts = []
+        for line in response.iter_lines():
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+                caption_parts.append(data.get("response", ""))
+                if data.get("done", False):
+                    break
+            except json.JSONDecodeError:
+                continue  # silently skip malformed lines
+
+        return "".join(caption_parts).strip()
+
 
 def replace_images_with_captions(markdown: str) -> str:
-    def replace(match):
-        alt, src = match.group(1), match.group(2)
+    """Caption every image link, CAPTION_CONCURRENCY at a time; repeated images are captioned once."""
+    pattern = r'!\[(.*?)\]\((.*?)\)'
+    sources = list(dict.fromkeys(match.group(2) for match in re.finditer(pattern, markdown)))
+    if not sources:
+        return markdown
+
+    images, hashes = {}, {}
+    for src in sources:
         try:
-            caption = caption_image(src)
-            # Attempt to delete only if local and file exists
-            if not src.startswith("http"):
-                img_path = Path(__file__).parent / "documents" / src
-                if img_path.exists():
-                    img_path.unlink()
-                    mcp_log("INFO", f"🗑️ Deleted image after captioning: {img_path}")
-            return f"**Image:** {caption}"
-        except Exception as e:
+            images[src] = load_image_bytes(src)  # read once: hashed here, captioned below if not cached
+        except (OSError, requests.RequestException) as e:
+            mcp_log("ERROR", f"❌ Image not available: {src} ({e})")
+            continue
+        hashes[src] = hashlib.blake2b(images[src], digest_size=16).hexdigest()
+
+    cache = open_caption_cache()
+    try:
+        unique = list(dict.fromkeys(hashes.values()))
+        captions = {}
+        for start in range(0, len(unique), 500):  # stay under SQLite's bound-parameter limit
+            batch = unique[start:start + 500]
+            captions.update(cache.execute(
+                f"SELECT hash, caption FROM captions WHERE hash IN ({','.join('?' * len(batch))})", batch
+            ).fetchall())
+
+        # First source seen for each uncached hash gets captioned
+        todo = {}
+        for src, digest in hashes.items():
+            if digest not in captions:
+                todo.setdefault(digest, src)
+        mcp_log("CAPTION", f"{len(sources)} images, {len(unique)} unique, {len(unique) - len(todo)} cached")
+
+        def caption_one(src: str) -> Optional[str]:
+            mcp_log("CAPTION", f"🖼️ Attempting to caption image: {src}")
+            try:
+                caption = generate_caption(images[src])
+            except Exception as e:
+                mcp_log("ERROR", f"⚠️ Failed to caption image {src}: {e}")
+                return None
+            mcp_log("CAPTION", f"✅ Caption generated: {caption}")
+            return caption or None
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=CAPTION_CONCURRENCY) as pool:
+            generated = dict(zip(todo, pool.map(caption_one, todo.values())))
+        fresh = {digest: caption for digest, caption in generated.items() if caption}
+        captions.update(fresh)
+        with cache:
+            cache.executemany("INSERT OR REPLACE INTO captions (hash, caption) VALUES (?, ?)", fresh.items())
+    finally:
+        cache.close()
+
+    # Attempt to delete only if local and file exists
+    for src in sources:
+        if src.startswith("http"):
+            continue
+        img_path = Path(__file__).parent / "documents" / src
+        try:
+            if img_path.exists():
+                img_path.unlink()
+                mcp_log("INFO", f"🗑️ Deleted image after captioning: {img_path}")
+        except OSError as e:
             mcp_log("WARN", f"Image deletion failed: {e}")
-            return f"[Image could not be processed: {src}]"
 
-    return re.sub(r'!\[(.*?)\]\((.*?)\)', replace, markdown)
+    def replace(match):
+        src = match.group(2)
+        caption = captions.get(hashes.get(src))
+        return f"**Image:** {caption}" if caption else f"[Image could not be processed: {src}]"
 
+    return re.sub(pattern, replace, markdown)
 
-@mcp.tool()
-def extract_webpage(input: UrlInput) -> MarkdownOutput:
-    """Extract and convert webpage content to markdown. Usage: extract_webpage|input={"url": "https://example.com"}"""
 
-    downloaded = trafilatura.fetch_url(input.url)
+def webpage_to_markdown(url: str) -> Optional[str]:
+    """Download and convert a webpage; images are left as links. None if the download failed."""
+    downloaded = trafilatura.fetch_url(url)
     if not downloaded:
-        return MarkdownOutput(markdown="Failed to download the webpage.")
+        return None
 
-    markdown = trafilatura.extract(
+    return trafilatura.extract(
         downloaded,
         include_comments=False,
         include_tables=True,
@@ -199,34 +1172,53 @@ def extract_webpage(input: UrlInput) -> MarkdownOutput:
         output_format='markdown'
     ) or ""
 
-    markdown = replace_images_with_captions(markdown)
-    return MarkdownOutput(markdown=markdown)
-
-@mcp.tool()
-def extract_pdf(input: FilePathInput) -> MarkdownOutput:
-    """Convert PDF file content to markdown format. Usage: extract_pdf|input={"file_path": "documents/dlf.pdf"}"""
-
-    if not os.path.exists(input.file_path):
-        return MarkdownOutput(markdown=f"File not found: {input.file_path}")
 
+def pdf_to_markdown(file_path: str, pages: Optional[list[int]] = None, doc=None) -> str:
+    """Convert a PDF (or some of its pages) to markdown, writing its images to documents/images/ uncaptioned."""
     ROOT = Path(__file__).parent.resolve()
     global_image_dir = ROOT / "documents" / "images"
     global_image_dir.mkdir(parents=True, exist_ok=True)
 
     # Actual markdown with relative image paths
     markdown = pymupdf4llm.to_markdown(
-        input.file_path,
+        doc if doc is not None else file_path,
+        pages=pages,
         write_images=True,
         image_path=str(global_image_dir)
     )
 
     # Re-point image links in the markdown
-    markdown = re.sub(
+    return re.sub(
         r'!\[\]\((.*?/images/)([^)]+)\)',
         r'![](images/\2)',
         markdown.replace("\\", "/")
     )
 
+
+def pdf_page_count(file_path: str) -> int:
+    with pymupdf.open(file_path) as doc:
+        return doc.page_count
+
+
+@mcp.tool()
+def extract_webpage(input: UrlInput) -> MarkdownOutput:
+    """Extract and convert webpage content to markdown. Usage: extract_webpage|input={"url": "https://example.com"}"""
+
+    markdown = webpage_to_markdown(input.url)
+    if markdown is None:
+        return MarkdownOutput(markdown="Failed to download the webpage.")
+
+    markdown = replace_images_with_captions(markdown)
+    return MarkdownOutput(markdown=markdown)
+
+@mcp.tool()
+def extract_pdf(input: FilePathInput) -> MarkdownOutput:
+    """Convert PDF file content to markdown format. Usage: extract_pdf|input={"file_path": "documents/dlf.pdf"}"""
+
+    if not os.path.exists(input.file_path):
+        return MarkdownOutput(markdown=f"File not found: {input.file_path}")
+
+    markdown = pdf_to_markdown(input.file_path)
     markdown = replace_images_with_captions(markdown)
     return MarkdownOutput(markdown=markdown)
 
@@ -296,128 +1288,816 @@ Keep markdown formatting intact.
     return final_chunks
 
 
+def split_sentences(text: str) -> list[str]:
+    """Sentence-ish units: sentence ends, blank lines and markdown headings all split."""
+    parts = re.split(r'(?<=[.!?])\s+|\n\s*\n|\n(?=#)', text)
+    return [p.strip() for p in parts if p and p.strip()]
 
 
+def embedding_chunks(
+    text: str,
+    max_words: int = CHUNK_MAX_WORDS,
+    min_words: int = CHUNK_MIN_WORDS,
+    percentile: float = CHUNK_BREAKPOINT_PERCENTILE,
+    overlap: int = CHUNK_OVERLAP_SENTENCES
+) -> list[str]:
+    """Split where consecutive sentence embeddings diverge most; no LLM calls."""
+    # Over-long "sentences" (tables, lists without punctuation) become word windows
+    sentences = [piece for s in split_sentences(text) for piece in chunk_text(s, max_words, 0)]
+    if len(sentences) < 2:
+        return [" ".join(sentences)] if sentences else []
 
+    vectors = get_embeddings(sentences)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-9
+    distances = 1.0 - np.einsum("ij,ij->i", vectors[:-1], vectors[1:])
+    # breaks[i] → topic boundary between sentence i and i + 1
+    breaks = distances > np.percentile(distances, percentile)
+    words = [len(s.split()) for s in sentences]
 
+    chunks, current, size, fresh = [], [], 0, False
+    for i, sentence in enumerate(sentences):
+        if fresh and size + words[i] > max_words:
+            chunks.append(current)
+            current = current[-overlap:] if overlap else []
+            size, fresh = sum(len(s.split()) for s in current), False
+        current.append(sentence)
+        size, fresh = size + words[i], True
+        if i < len(breaks) and breaks[i] and size >= min_words:
+            chunks.append(current)
+            current = current[-overlap:] if overlap else []
+            size, fresh = sum(len(s.split()) for s in current), False
 
-def process_documents():
-    """Process documents and create FAISS index using unified multimodal strategy."""
-    mcp_log("INFO", "Indexing documents with unified RAG pipeline...")
-    ROOT = Path(__file__).parent.resolve()
-    DOC_PATH = ROOT / "documents"
-    INDEX_CACHE = ROOT / "faiss_index"
-    INDEX_CACHE.mkdir(exist_ok=True)
-    INDEX_FILE = INDEX_CACHE / "index.bin"
-    METADATA_FILE = INDEX_CACHE / "metadata.json"
-    CACHE_FILE = INDEX_CACHE / "doc_index_cache.json"
+    # A remainder holding only the overlap adds nothing new
+    if fresh:
+        chunks.append(current)
+    return [" ".join(chunk) for chunk in chunks]
 
-    def file_hash(path):
-        return hashlib.md5(Path(path).read_bytes()).hexdigest()
 
-    CACHE_META = json.loads(CACHE_FILE.read_text()) if CACHE_FILE.exists() else {}
-    metadata = json.loads(METADATA_FILE.read_text()) if METADATA_FILE.exists() else []
-    index = faiss.read_index(str(INDEX_FILE)) if INDEX_FILE.exists() else None
+def chunk_document(text: str, method: str = CHUNKER) -> list[str]:
+    if method == "llm":
+        return semantic_merge(text)
+    return embedding_chunks(text)
 
-    for file in DOC_PATH.glob("*.*"):
-        fhash = file_hash(file)
-        if file.name in CACHE_META and CACHE_META[file.name] == fhash:
-            mcp_log("SKIP", f"Skipping unchanged file: {file.name}")
-            continue
 
-        mcp_log("PROC", f"Processing: {file.name}")
-        try:
-            ext = file.suffix.lower()
-            markdown = ""
 
-            if ext == ".pdf":
-                mcp_log("INFO", f"Using MuPDF4LLM to extract {file.name}")
-                markdown = extract_pdf(FilePathInput(file_path=str(file))).markdown
 
-            elif ext in [".html", ".htm", ".url"]:
-                mcp_log("INFO", f"Using Trafilatura to extract {file.name}")
-                markdown = extract_webpage(UrlInput(url=file.read_text().strip())).markdown
 
-            else:
-                # Fallback to MarkItDown for other formats
-                converter = MarkItDown()
-                mcp_log("INFO", f"Using MarkItDown fallback for {file.name}")
-                markdown = converter.convert(str(file)).text_content
 
-            if not markdown.strip():
-                mcp_log("WARN", f"No content extracted from {file.name}")
+
+# === INGESTION PIPELINE ===
+# extract (process pool) → caption + chunk + embed (asyncio) → commit (one file at a time, in order)
+
+def extract_markdown(path: str) -> str:
+    """CPU-bound extraction; runs in a worker process, so it must stay a picklable top-level function."""
+    file = Path(path)
+    ext = file.suffix.lower()
+
+    if ext == ".pdf":
+        mcp_log("INFO", f"Using MuPDF4LLM to extract {file.name}")
+        return pdf_to_markdown(path)
+
+    elif ext in [".html", ".htm", ".url"]:
+        mcp_log("INFO", f"Using Trafilatura to extract {file.name}")
+        return webpage_to_markdown(file.read_text().strip()) or ""
+
+    # Fallback to MarkItDown for other formats
+    mcp_log("INFO", f"Using MarkItDown fallback for {file.name}")
+    return MarkItDown().convert(path).text_content
+
+
+def prepare_chunks(file: Path, markdown: str, chunker: str = CHUNKER) -> list[str]:
+    """Caption images (PDF / web sources) and split the markdown into chunks."""
+    if file.suffix.lower() in [".pdf", ".html", ".htm", ".url"]:
+        markdown = replace_images_with_captions(markdown)
+
+    if not markdown.strip():
+        mcp_log("WARN", f"No content extracted from {file.name}")
+        return []
+
+    if len(markdown.split()) < 10:
+        mcp_log("WARN", f"Content too short for semantic merge in {file.name} → Skipping chunking.")
+        return [markdown.strip()]
+
+    mcp_log("INFO", f"Running {chunker} chunking on {file.name} with {len(markdown.split())} words")
+    return chunk_document(markdown, chunker)
+
+
+async def stream_pdf_chunks(
+    file: Path, pool: concurrent.futures.Executor, client: httpx.AsyncClient, chunker: str = CHUNKER
+) -> AsyncIterator[tuple[list[str], np.ndarray]]:
+    """Page-bounded PDF pipeline: extract (worker) → caption → chunk → embed, one page batch at a time.
+
+    Yields each batch's finished chunks and vectors for the caller to commit before the next
+    batch is read, so memory holds one page batch regardless of document size. The last chunk
+    of each batch may continue on the next pages, so it is carried over and re-chunked with them.
+    """
+    loop = asyncio.get_running_loop()
+    page_count = await loop.run_in_executor(pool, pdf_page_count, str(file))
+    carry, done = "", 0
+    for start in range(0, page_count, PDF_PAGE_BATCH):
+        pages = range(start, min(start + PDF_PAGE_BATCH, page_count))
+        markdown = await loop.run_in_executor(pool, pdf_to_markdown, str(file), list(pages))
+        text = (carry + "\n\n" + await asyncio.to_thread(replace_images_with_captions, markdown)).strip()
+        if not text:
+            continue
+        batch = await asyncio.to_thread(chunk_document, text, chunker) if len(text.split()) >= 10 else [text]
+        carry = batch.pop()
+        if batch:
+            yield batch, await embed_batches_async(batch, client)
+            done += len(batch)
+        mcp_log("PROC", f"{file.name}: pages {pages.start + 1}-{pages.stop} → {done} chunks so far")
+
+    if carry:
+        yield [carry], await embed_batches_async([carry], client)
+
+
+def is_streamed(file: Path) -> bool:
+    if file.suffix.lower() != ".pdf":
+        return False
+    try:
+        return pdf_page_count(str(file)) >= PDF_STREAM_MIN_PAGES
+    except Exception:
+        return False
+
+
+def worker_context():
+    # The server is multi-threaded (stdio, search pool, watcher); forking it can copy a held lock into
+    # the child, so extraction workers come from a clean forkserver (spawn where that's unavailable)
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+async def ingest_files(jobs: list[tuple[Path, str]], commit, chunker: str = CHUNKER) -> None:
+    """Run jobs through the staged pipeline; commit(file, fhash, chunks, vectors) sees them in job order."""
+    loop = asyncio.get_running_loop()
+    extracted: asyncio.Queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+    prepared: asyncio.Queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+
+    # Window over job order: a file only starts once fewer than PIPELINE_MAX_IN_FLIGHT earlier ones
+    # await their commit, so one slow file can't make every later result pile up in the reorder buffer.
+    # Semaphore waiters are served FIFO and jobs start in order, so the oldest file always gets in.
+    window = asyncio.Semaphore(max(PIPELINE_MAX_IN_FLIGHT, 1))
+    turns = [asyncio.Event() for _ in jobs]  # turns[seq] is set once every earlier file is committed
+    if turns:
+        turns[0].set()
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=min(EXTRACT_WORKERS, len(jobs)), mp_context=worker_context(), initializer=EXTRACT_WORKER_INIT
+    ) as pool:
+        limits = httpx.Limits(max_connections=EMBED_CONCURRENCY)
+        async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+
+            async def extract_stage():
+                # A slot is held until the result is queued, bounding extracted-but-unconsumed files
+                slots = asyncio.Semaphore(EXTRACT_WORKERS)
+
+                async def extract_one(seq: int, file: Path, fhash: str):
+                    await window.acquire()
+                    if is_streamed(file):
+                        await stream_one(seq, file, fhash)
+                        return
+                    async with slots:
+                        mcp_log("PROC", f"Processing: {file.name}")
+                        try:
+                            markdown = await loop.run_in_executor(pool, extract_markdown, str(file))
+                        except Exception as e:
+                            mcp_log("ERROR", f"Failed to process {file.name}: {e}")
+                            markdown = None
+                        await extracted.put((seq, file, fhash, markdown))
+
+                await asyncio.gather(*(extract_one(seq, *job) for seq, job in enumerate(jobs)))
+                for _ in range(PIPELINE_CONCURRENCY):
+                    await extracted.put(None)
+
+            async def stream_one(seq: int, file: Path, fhash: str):
+                # Page batches are committed as they are embedded, which has to happen in job order:
+                # wait until every earlier file is committed, then bypass the prepare and commit stages
+                await turns[seq].wait()
+                mcp_log("PROC", f"Processing: {file.name}")
+                mcp_log("INFO", f"Streaming {file.name} in {PDF_PAGE_BATCH}-page batches")
+                done = 0
+                try:
+                    async for chunks, vectors in stream_pdf_chunks(file, pool, client, chunker):
+                        commit(file, fhash, chunks, vectors, start=done, final=False)
+                        done += len(chunks)
+                    commit(file, fhash, [], None, start=done, final=True)
+                except Exception as e:
+                    mcp_log("ERROR", f"Failed to process {file.name}: {e}")
+                await prepared.put((seq, file, fhash, None))
+
+            async def prepare_worker():
+                while (job := await extracted.get()) is not None:
+                    seq, file, fhash, markdown = job
+                    result = None
+                    if markdown is not None:
+                        try:
+                            chunks = await asyncio.to_thread(prepare_chunks, file, markdown, chunker)
+                            if chunks:
+                                start = time.perf_counter()
+                                vectors = await embed_batches_async(chunks, client)
+                                elapsed = time.perf_counter() - start
+                                mcp_log("EMBED", f"{len(chunks)} chunks from {file.name} in {elapsed:.2f}s ({len(chunks) / max(elapsed, 1e-9):.1f} chunks/s)")
+                                result = (chunks, vectors)
+                        except Exception as e:
+                            mcp_log("ERROR", f"Failed to process {file.name}: {e}")
+                    await prepared.put((seq, file, fhash, result))
+                await prepared.put(None)
+
+            async def commit_stage():
+                # Reorder buffer: files finish out of order but are committed in job order,
+                # so FAISS ids and chunk rows come out the same on every run.
+                ready, next_seq, finished = {}, 0, 0
+                while finished < PIPELINE_CONCURRENCY:
+                    item = await prepared.get()
+                    if item is None:
+                        finished += 1
+                        continue
+                    ready[item[0]] = item
+                    while next_seq in ready:
+                        _, file, fhash, result = ready.pop(next_seq)
+                        if result is not None:
+                            try:
+                                commit(file, fhash, *result)
+                            except Exception as e:
+                                mcp_log("ERROR", f"Failed to commit {file.name}: {e}")
+                        next_seq += 1
+                        window.release()
+                        if next_seq < len(turns):
+                            turns[next_seq].set()
+
+            await asyncio.gather(
+                extract_stage(),
+                *(prepare_worker() for _ in range(PIPELINE_CONCURRENCY)),
+                commit_stage()
+            )
+
+
+def load_id_index(path: Path):
+    """Load index.bin as an IndexIDMap2, upgrading legacy sequential-id flat indexes in place."""
+    if not path.exists():
+        return None
+    index = faiss.read_index(str(path))
+    if isinstance(index, faiss.IndexIDMap):
+        return index
+    mcp_log("INFO", f"Upgrading {path.name} to stable ids ({index.ntotal} vectors)")
+    upgraded = faiss.IndexIDMap2(faiss.IndexFlatL2(index.d))
+    if index.ntotal:
+        upgraded.add_with_ids(index.reconstruct_n(0, index.ntotal), np.arange(index.ntotal, dtype=np.int64))
+    return upgraded
+
+
+def file_fingerprint(path: Path) -> tuple[int, int, int]:
+    st = path.stat()
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def file_hash(path: Path, algorithm: str = "blake2b") -> str:
+    """Streamed content hash; hashlib drops the GIL, so HASH_WORKERS threads read in parallel."""
+    with open(path, "rb") as f:
+        if algorithm == "md5":  # hashes stored before the switch to BLAKE2
+            return hashlib.file_digest(f, "md5").hexdigest()
+        return hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=32)).hexdigest()
+
+
+def embedding_signature() -> str:
+    """What produced a shard's vectors; l2_similarity and dense ranking rely on them being unit length."""
+    return f"{EMBED_MODEL} /api/embed normalized, dim {EMBED_DIM or 'full'}"
+
+
+def reset_shard(store: sqlite3.Connection, index_path: Path):
+    """Forget every vector and document of a shard so the next scan ingests it again (ids stay unique)."""
+    with store:
+        for table in ("chunks", "vectors", "vector_bands", "tombstones", "index_wal", "documents"):
+            store.execute(f"DELETE FROM {table}")
+        for key in ("index_config", "index_factory", "index_built_n"):
+            store.execute("DELETE FROM meta WHERE key = ?", (key,))
+    index_path.unlink(missing_ok=True)
+
+
+def replay_wal(store: sqlite3.Connection, index):
+    """Re-add vectors committed after the last checkpoint that index.bin doesn't have yet."""
+    indexed = faiss.vector_to_array(index.id_map) if index is not None else np.empty(0, dtype=np.int64)
+    # Only vectors still in use; replaced/deleted ones would come back as ghosts
+    rows = store.execute(
+        "SELECT w.id, w.vector FROM index_wal w JOIN vectors v ON v.id = w.id ORDER BY w.id"
+    ).fetchall()
+    missing = ~np.isin(np.array([row[0] for row in rows], dtype=np.int64), indexed)
+    rows = [row for row, keep in zip(rows, missing) if keep]
+    if not rows:
+        return index
+    vectors = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+    if index is None:
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+    index.add_with_ids(vectors, np.array([row[0] for row in rows], dtype=np.int64))
+    mcp_log("INFO", f"Recovered {len(rows)} vectors from the write-ahead log")
+    return index
+
+
+def checkpoint_index(store: sqlite3.Connection, index, path: Path):
+    """Persist index.bin, then truncate the WAL it now contains."""
+    write_index_atomic(index, path)
+    # After the rename: a crash in between only means replaying vectors already present
+    with store:
+        store.execute("DELETE FROM index_wal")
+
+
+def index_config() -> str:
+    """Configured encoding as a factory template; a shard built with another one gets rebuilt."""
+    return compose_factory(INDEX_FACTORY, "float32", INDEX_REFINE)
+
+
+def resolve_factory(template: str, n: int) -> str:
+    return template.format(nlist=max(16, int(4 * np.sqrt(max(n, 1)))))
+
+
+def min_training_vectors(factory: str) -> int:
+    """Vectors needed before the factory can be trained well (FAISS wants ~39 per centroid)."""
+    need = 0
+    nlist = re.search(r"IVF(\d+)", factory)
+    if nlist:
+        need = max(need, 39 * int(nlist.group(1)))
+    if re.search(r"(^|,)PQ\d+", factory):
+        need = max(need, 39 * 256)
+    if re.search(r"(^|,)SQ\d", factory):
+        need = max(need, 1000)  # per-dimension ranges from a handful of vectors clip everything added later
+    return need
+
+
+def exact_source(index):
+    """The part of the index that holds vectors losslessly, or None if it only has compressed codes."""
+    inner = inner_index(index)
+    source = faiss.downcast_index(inner.refine_index) if isinstance(inner, faiss.IndexRefine) else inner
+    return source if isinstance(source, (faiss.IndexIVFFlat, faiss.IndexFlat)) else None
+
+
+def exact_vectors(index) -> Optional[tuple[np.ndarray, np.ndarray]]:
+    """(vectors, ids) held losslessly by the index, or None if it only has compressed codes."""
+    source = exact_source(index)
+    if source is None:
+        return None
+    if isinstance(source, faiss.IndexIVFFlat):
+        source.make_direct_map()
+    return source.reconstruct_n(0, source.ntotal), faiss.vector_to_array(index.id_map)
+
+
+def build_index(vectors: np.ndarray, ids: np.ndarray, factory: str):
+    """IndexIDMap2 over a freshly created (and, if needed, trained) factory index."""
+    inner = create_index(factory, vectors.shape[1])
+    if not inner.is_trained:
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), size=min(len(vectors), 100_000), replace=False)]
+        inner.train(sample)
+    index = faiss.IndexIDMap2(inner)
+    index.add_with_ids(vectors, ids)
+    return index
+
+
+def rebuild_index(store: sqlite3.Connection, shard: "Shard", index) -> bool:
+    """Re-encode live vectors into the configured index type, dropping tombstoned ones; False if impossible."""
+    exact = exact_vectors(index)
+    if exact is None:
+        return False
+    vectors, ids = exact
+    dead = np.array([row[0] for row in store.execute("SELECT id FROM tombstones")], dtype=np.int64)
+    live = ~np.isin(ids, dead)
+    vectors, ids = vectors[live], ids[live]
+    template = index_config()
+    factory = resolve_factory(template, len(ids))
+    if len(ids) < min_training_vectors(factory):
+        factory = "Flat"  # too few vectors to train yet; stays exact until a later rebuild
+
+    start = time.perf_counter()
+    rebuilt = build_index(vectors, ids, factory) if len(ids) else faiss.IndexIDMap2(faiss.IndexFlatL2(index.d))
+    write_index_atomic(rebuilt, shard.index_path)
+    with store:
+        store.executemany("DELETE FROM tombstones WHERE id = ?", [(int(i),) for i in dead])
+        set_meta(store, "index_config", template if factory != "Flat" else "Flat")
+        set_meta(store, "index_factory", factory)
+        set_meta(store, "index_built_n", len(ids))
+    refresh_snapshot(shard)
+    mcp_log("INFO", f"Rebuilt {shard.name} index as {factory} ({len(ids)} vectors) in {time.perf_counter() - start:.2f}s")
+    return True
+
+
+def maintain_index(collection: str):
+    """After an ingest run: train/re-encode into the configured index type, or compact tombstones."""
+    shard = get_shard(collection)
+    if not shard.index_path.exists():
+        return
+    store = open_chunk_store(shard.db_path)
+    try:
+        dead = store.execute("SELECT COUNT(*) FROM tombstones").fetchone()[0]
+        live = store.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+        built = get_meta(store, "index_config", "Flat")
+        built_n = get_meta(store, "index_built_n", 0)
+        target = resolve_factory(index_config(), live)
+        # Retrain when the configuration changed and there is enough data, or a trained encoding
+        # (IVF lists, SQ ranges, PQ codebooks) has outgrown the data it was trained on
+        retrain = built != index_config() and live >= min_training_vectors(target)
+        regrow = built == index_config() and min_training_vectors(target) > 0 and live >= 4 * max(built_n, 1)
+        if retrain or regrow:
+            index = load_id_index(shard.index_path)
+            # Compressed codes alone (no RFlat) can't be re-encoded, so growth leaves their training as is
+            if retrain or exact_source(index) is not None:
+                _index_status["state"] = "rebuilding"
+                if rebuild_index(store, shard, index):
+                    return
+                mcp_log("WARN", f"{collection} index holds no exact vectors to re-encode; delete its shard to re-embed")
+    finally:
+        store.close()
+
+    if dead and dead >= COMPACT_RATIO * (dead + live):
+        _index_status["state"] = "compacting"
+        compact_index(collection)
+
+
+def compact_index(collection: str = DEFAULT_COLLECTION):
+    """Physically remove tombstoned vectors from the collection's index.bin."""
+    shard = get_shard(collection)
+    INDEX_FILE = shard.index_path
+    store = open_chunk_store(shard.db_path)
+    try:
+        dead = np.array([row[0] for row in store.execute("SELECT id FROM tombstones")], dtype=np.int64)
+        index = load_id_index(INDEX_FILE)
+        if index is None or not len(dead):
+            return
+        start = time.perf_counter()
+        try:
+            removed = index.remove_ids(faiss.IDSelectorBatch(dead))
+        except RuntimeError:  # e.g. IndexRefine: re-encode the survivors instead
+            if not rebuild_index(store, shard, index):
+                mcp_log("WARN", f"{collection} index can't drop tombstoned vectors; they stay filtered at search")
+            return
+        write_index_atomic(index, INDEX_FILE)
+        # Index first: a crash here leaves tombstones for ids already gone, which is harmless
+        with store:
+            store.executemany("DELETE FROM tombstones WHERE id = ?", [(int(i),) for i in dead])
+        refresh_snapshot(shard)
+        mcp_log("INFO", f"Compacted {collection} index: removed {removed} vectors in {time.perf_counter() - start:.2f}s")
+    finally:
+        store.close()
+
+
+def process_documents(changed: Optional[set[str]] = None):
+    """Process documents and create FAISS index using unified multimodal strategy.
+
+    changed limits the run to those paths relative to documents/ ("a.pdf", "finance/b.pdf";
+    "finance/" rescans a whole collection). None scans every collection.
+    Writes index files; the server only calls it from the indexing worker thread.
+    """
+    if changed is None:
+        targets = dict.fromkeys(collection_names())
+    else:
+        targets = {}
+        for relative in sorted(changed):
+            if relative.endswith("/"):
+                targets[relative.rstrip("/")] = None
                 continue
+            collection, name = split_collection(relative)
+            if collection in targets and targets[collection] is None:
+                continue  # already a full rescan
+            targets.setdefault(collection, set()).add(name)
+
+    # Each collection is its own shard: a change re-indexes only the shard it lives in
+    for collection, names in targets.items():
+        _index_status.update(state="indexing", collection=collection)
+        _process_documents(collection, names)
+        maintain_index(collection)
+
+
+def _process_documents(collection: str = DEFAULT_COLLECTION, changed: Optional[set[str]] = None):
+    mcp_log("INFO", f"Indexing collection {collection} with unified RAG pipeline...")
+    DOC_PATH = collection_docs(collection)
+    INDEX_CACHE = shard_dir(collection)
+    INDEX_CACHE.mkdir(parents=True, exist_ok=True)
+    INDEX_FILE = INDEX_CACHE / "index.bin"
 
-            if len(markdown.split()) < 10:
-                mcp_log("WARN", f"Content too short for semantic merge in {file.name} → Skipping chunking.")
-                chunks = [markdown.strip()]
-            else:
-                mcp_log("INFO", f"Running semantic merge on {file.name} with {len(markdown.split())} words")
-                chunks = semantic_merge(markdown)
-
-
-            embeddings_for_file = []
-            new_metadata = []
-            for i, chunk in enumerate(tqdm(chunks, desc=f"Embedding {file.name}")):
-                embedding = get_embedding(chunk)
-                embeddings_for_file.append(embedding)
-                new_metadata.append({
-                    "doc": file.name,
-                    "chunk": chunk,
-                    "chunk_id": f"{file.stem}_{i}"
-                })
-
-            if embeddings_for_file:
-                if index is None:
-                    dim = len(embeddings_for_file[0])
-                    index = faiss.IndexFlatL2(dim)
-                index.add(np.stack(embeddings_for_file))
-                metadata.extend(new_metadata)
-                CACHE_META[file.name] = fhash
-
-                # ✅ Immediately save index and metadata
-                CACHE_FILE.write_text(json.dumps(CACHE_META, indent=2))
-                METADATA_FILE.write_text(json.dumps(metadata, indent=2))
-                faiss.write_index(index, str(INDEX_FILE))
-                mcp_log("SAVE", f"Saved FAISS index and metadata after processing {file.name}")
+    store = open_chunk_store(INDEX_CACHE / "chunks.db")
+    # Vectors from another embedding setup can't share an index: re-embed the collection from scratch
+    embedding = embedding_signature()
+    stored = get_meta(store, "embedding")
+    if stored is None and (INDEX_FILE.exists() or store.execute("SELECT 1 FROM vectors LIMIT 1").fetchone()):
+        stored = "unnormalized /api/embeddings"  # vectors written before the signature was recorded
+    if stored is not None and stored != embedding:
+        mcp_log("INFO", f"Embeddings changed ({stored} → {embedding}); re-embedding collection {collection}")
+        reset_shard(store, INDEX_FILE)
+    # Chunks made by another chunker: forget the documents so each is re-chunked (unchanged chunks keep their vectors)
+    chunker = collection_chunker(collection)
+    if get_meta(store, "chunker", chunker) != chunker:
+        mcp_log("INFO", f"Chunker changed to {chunker}; re-chunking collection {collection}")
+        with store:
+            store.execute("UPDATE documents SET hash = '', size = NULL")
+    with store:
+        set_meta(store, "embedding", embedding)
+        set_meta(store, "chunker", chunker)
+    index = replay_wal(store, load_id_index(INDEX_FILE))
+    pending = store.execute("SELECT COUNT(*) FROM index_wal").fetchone()[0]
+
+    # Drop rows a pre-WAL run committed without ever saving their vectors (ids only grow);
+    # their documents are forgotten whole so the next scan ingests them again
+    max_id = int(faiss.vector_to_array(index.id_map).max()) if index is not None and index.ntotal else -1
+    orphaned = [row[0] for row in store.execute("SELECT DISTINCT doc FROM chunks WHERE vector_id > ?", (max_id,))]
+    with store:
+        for name in orphaned:
+            tombstone_document(store, name)
+            store.execute("DELETE FROM documents WHERE name = ?", (name,))
+        store.execute("DELETE FROM vectors WHERE id > ?", (max_id,))
+        store.execute("DELETE FROM vector_bands WHERE vector_id > ?", (max_id,))
+    if orphaned:
+        mcp_log("WARN", f"Re-ingesting {len(orphaned)} documents whose vectors were never saved")
+        pending += len(orphaned)
+
+    known = {row[0]: row[1:] for row in store.execute("SELECT name, hash, size, mtime_ns, inode FROM documents")}
+    CACHE_META = {name: row[0] for name, row in known.items()}
+
+    if changed is None:
+        candidates = sorted(file for file in DOC_PATH.glob("*.*") if file.is_file())
+    else:
+        candidates = sorted(DOC_PATH / name for name in changed if (DOC_PATH / name).is_file())
+
+    # Documents removed from disk: tombstone their vectors and forget them
+    present = {file.name for file in candidates}
+    removed = [name for name in CACHE_META if name not in present and (changed is None or name in changed)]
+    if removed:
+        with store:
+            for name in removed:
+                mcp_log("DEL", f"Removing deleted file from index: {name} ({tombstone_document(store, name)} chunks)")
+                store.execute("DELETE FROM documents WHERE name = ?", (name,))
+                del CACHE_META[name]
+        pending += len(removed)  # new index.bin stamp, so searches pick up the tombstones
+
+    # Level 1: size/mtime/inode match the indexed fingerprint → unchanged, nothing read
+    fingerprints, to_hash = {}, []
+    for file in candidates:
+        try:
+            fingerprints[file.name] = file_fingerprint(file)
+        except OSError:
+            continue  # vanished since the scan; the watcher reports the deletion
+        if known.get(file.name, (None,))[1:] != fingerprints[file.name]:
+            to_hash.append(file)
+
+    # Level 2: content hash only on mismatch, so a touched-but-identical file isn't re-ingested
+    with concurrent.futures.ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+        hashes = dict(zip(to_hash, pool.map(file_hash, to_hash)))
+
+    jobs, touched = [], []
+    for file, fhash in hashes.items():
+        stored = CACHE_META.get(file.name)
+        if stored == fhash or (stored and len(stored) == 32 and file_hash(file, "md5") == stored):
+            touched.append((fhash, *fingerprints[file.name], file.name))
+        else:
+            jobs.append((file, fhash))
+    if touched:
+        with store:
+            store.executemany(
+                "UPDATE documents SET hash = ?, size = ?, mtime_ns = ?, inode = ? WHERE name = ?", touched
+            )
+    mcp_log("SKIP", f"{len(candidates) - len(jobs)} unchanged files ({len(to_hash)} hashed)")
+    _index_status.update(files_total=len(jobs), files_done=0, current=None)
+
+    last_checkpoint = time.monotonic()
+
+    def checkpoint():
+        nonlocal pending, last_checkpoint
+        if index is not None and pending:
+            checkpoint_index(store, index, INDEX_FILE)
+            mcp_log("SAVE", f"Checkpointed {collection} index ({index.ntotal} vectors, {pending} changes)")
+            refresh_snapshot(get_shard(collection))
+        pending, last_checkpoint = 0, time.monotonic()
+
+    def commit(
+        file: Path, fhash: str, chunks: list[str], vectors: Optional[np.ndarray], start: int = 0, final: bool = True
+    ):
+        """Commit a file's chunks; a streamed file arrives in parts (start = chunks committed before it)."""
+        nonlocal index, pending
+        if chunks:
+            if index is None:
+                index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+        # ✅ One transaction replaces the document's rows (unused old vectors tombstoned), logs the
+        # new vectors to the WAL and marks the file done; index.bin is only rewritten at checkpoints.
+        # Until its final part, a streamed file's row has no hash, so an interrupted one is re-ingested.
+        with store:
+            old_vectors = delete_document(store, file.name) if start == 0 else []
+            ids = allocate_ids(store, len(chunks))
+            vector_ids, fresh = [], []
+            for i, chunk in enumerate(chunks):
+                exact, minhash, words = chunk_signature(chunk)
+                # Old rows are already gone but their vectors aren't, so unchanged chunks keep theirs
+                duplicate = find_duplicate(store, exact, minhash, words) if DEDUP_CHUNKS else None
+                if duplicate is None:
+                    duplicate = int(ids[i])
+                    fresh.append(i)
+                    store_signature(store, duplicate, exact, minhash)
+                vector_ids.append(duplicate)
+            store.executemany(
+                "INSERT INTO chunks (id, doc, chunk_id, chunk, vector_id) VALUES (?, ?, ?, ?, ?)",
+                [(int(ids[i]), file.name, f"{file.stem}_{start + i}", chunk, vector_ids[i]) for i, chunk in enumerate(chunks)]
+            )
+            store.executemany(
+                "INSERT INTO index_wal (id, vector) VALUES (?, ?)",
+                [(int(ids[i]), vectors[i].tobytes()) for i in fresh]
+            )
+            release_vectors(store, old_vectors)
+            store.execute(
+                "INSERT OR REPLACE INTO documents (name, hash, size, mtime_ns, inode) VALUES (?, ?, ?, ?, ?)",
+                (file.name, fhash, *fingerprints[file.name]) if final else (file.name, "", None, None, None)
+            )
+        if old_vectors:
+            mcp_log("INFO", f"Replaced {len(old_vectors)} stale chunks of {file.name}")
+        if fresh:
+            index.add_with_ids(vectors[fresh], ids[fresh])
+        pending += len(fresh) + len(old_vectors)  # tombstones also need a new snapshot
+        if final:
+            CACHE_META[file.name] = fhash
+            _index_status["files_done"] += 1
+            _index_status["current"] = file.name
+        if chunks:
+            mcp_log("SAVE", f"Committed {len(chunks)} chunks of {file.name} ({len(chunks) - len(fresh)} shared with existing chunks)")
+        if pending >= CHECKPOINT_CHUNKS or time.monotonic() - last_checkpoint >= CHECKPOINT_SECONDS:
+            checkpoint()
 
+    try:
+        if jobs:
+            start = time.perf_counter()
+            run_sync(ingest_files(jobs, commit, chunker))
+            mcp_log("INFO", f"Ingested {len(jobs)} files in {time.perf_counter() - start:.1f}s")
+    finally:
+        checkpoint()
+        store.close()
+
+
+# === INDEXING WORKER ===
+# The only writer of faiss_index/: requests are queued, runs publish snapshots as they checkpoint
+
+_index_requests: "queue.Queue[Optional[set[str]]]" = queue.Queue()
+_index_worker: Optional[threading.Thread] = None
+_index_status = {
+    "state": "idle",  # idle, indexing, rebuilding, compacting
+    "collection": None,  # being indexed
+    "files_total": 0,
+    "files_done": 0,
+    "current": None,  # last file committed
+    "runs": 0,
+    "last_started": None,
+    "last_finished": None,
+    "last_error": None,
+}
+
+
+def request_indexing(changed: Optional[set[str]] = None):
+    """Ask the worker to index the changed file names (None = full scan of documents/); returns immediately."""
+    _index_requests.put(set(changed) if changed is not None else None)
+
+
+def indexing_worker():
+    while True:
+        requests = [_index_requests.get()]
+        # Requests queued behind this one are covered by the same run
+        while not _index_requests.empty():
+            requests.append(_index_requests.get_nowait())
+        changed = None if None in requests else set().union(*requests)
+        _index_status.update(state="indexing", last_started=time.time(), last_error=None)
+        try:
+            process_documents(changed)
         except Exception as e:
-            mcp_log("ERROR", f"Failed to process {file.name}: {e}")
+            mcp_log("ERROR", f"Indexing run failed: {e}")
+            _index_status["last_error"] = str(e)
+        _index_status.update(state="idle", collection=None, last_finished=time.time(), runs=_index_status["runs"] + 1)
 
 
+def start_indexing_worker():
+    global _index_worker
+    if _index_worker is None:
+        _index_worker = threading.Thread(target=indexing_worker, name="indexing-worker", daemon=True)
+        _index_worker.start()
 
-def ensure_faiss_ready():
-    from pathlib import Path
-    index_path = ROOT / "faiss_index" / "index.bin"
-    meta_path = ROOT / "faiss_index" / "metadata.json"
-    if not (index_path.exists() and meta_path.exists()):
-        mcp_log("INFO", "Index not found — running process_documents()...")
-        process_documents()
-    else:
-        mcp_log("INFO", "Index already exists. Skipping regeneration.")
+
+@mcp.resource("status://indexing")
+def indexing_status() -> str:
+    """Document indexing progress and the generation searches are currently served from."""
+    return json.dumps({
+        **_index_status,
+        "queued": _index_requests.qsize(),
+        "collections": {
+            shard.name: {
+                "loaded": shard.snapshot is not None,
+                "generation": shard.generation,
+                "vectors": shard.snapshot.index.ntotal if shard.snapshot else None,
+            }
+            for shard in list(_shards.values())
+        },
+    }, indent=2)
+
+
+# === DOCUMENT WATCHER ===
+# File events → debounce → request_indexing(changed paths); files in documents/ and one folder level below
+
+_watch_events: "queue.Queue[str]" = queue.Queue()
+
+
+def is_document(name: str) -> bool:
+    # Same files process_documents globs ("*.*"), minus editor lock/temp files
+    return "." in name and not name.startswith((".", "~$")) and not name.endswith((".tmp", ".part", ".crdownload"))
+
+
+def watched_path(doc_path: Path, path: str, is_directory: bool = False) -> Optional[str]:
+    """Path relative to documents/ as process_documents takes it, or None if not indexed."""
+    try:
+        parts = Path(os.fsdecode(path)).relative_to(doc_path).parts
+    except ValueError:
+        return None
+    if len(parts) == 1 and is_directory:
+        # A collection folder moved or removed as a whole: rescan it
+        return f"{parts[0]}/" if is_collection_name(parts[0]) else None
+    if is_directory or not is_document(parts[-1]):
+        return None
+    if len(parts) == 1 or (len(parts) == 2 and is_collection_name(parts[0])):
+        return "/".join(parts)
+    return None
+
+
+def debounce_changes():
+    while True:
+        changed = {_watch_events.get()}
+        # Wait for the burst to settle (copies, editors saving in several writes)
+        while True:
+            try:
+                changed.add(_watch_events.get(timeout=WATCH_DEBOUNCE_SECONDS))
+            except queue.Empty:
+                break
+        mcp_log("WATCH", f"{len(changed)} changed: {', '.join(sorted(changed))}")
+        request_indexing(changed)
+
+
+def stat_documents(doc_path: Path) -> dict[str, tuple]:
+    stats = {}
+    for file in [*doc_path.glob("*.*"), *doc_path.glob("*/*.*")]:
+        relative = watched_path(doc_path, str(file))
+        if relative is None:
+            continue
+        try:
+            st = file.stat()
+        except OSError:
+            continue
+        stats[relative] = (st.st_mtime_ns, st.st_size)
+    return stats
+
+
+def poll_documents(doc_path: Path, seen: dict[str, tuple]):
+    """Fallback watcher: diff stat() of documents/ every WATCH_POLL_SECONDS."""
+    while True:
+        time.sleep(WATCH_POLL_SECONDS)
+        current = stat_documents(doc_path)
+        for relative in seen.keys() | current.keys():
+            if seen.get(relative) != current.get(relative):
+                _watch_events.put(relative)
+        seen = current
+
+
+def start_document_watcher(doc_path: Path = DOC_DIR):
+    doc_path.mkdir(exist_ok=True)
+    threading.Thread(target=debounce_changes, name="watch-debounce", daemon=True).start()
+
+    if Observer is not None:
+        class DocumentEvents(FileSystemEventHandler):
+            def on_any_event(self, event):
+                # Reads (opened / closed_no_write) come from ingestion itself and must not re-trigger it
+                if event.event_type not in ("created", "modified", "deleted", "moved", "closed"):
+                    return
+                if event.is_directory and event.event_type not in ("created", "deleted", "moved"):
+                    return  # a folder's mtime changes with every file added; the file events cover it
+                for path in (event.src_path, getattr(event, "dest_path", "")):
+                    relative = watched_path(doc_path, path, event.is_directory) if path else None
+                    if relative is not None:
+                        _watch_events.put(relative)
+
+        try:
+            observer = Observer()
+            observer.schedule(DocumentEvents(), str(doc_path), recursive=True)
+            observer.daemon = True
+            observer.start()
+            mcp_log("WATCH", f"Watching {doc_path} ({type(observer).__name__})")
+            return
+        except Exception as e:  # e.g. inotify watch limit reached
+            mcp_log("WARN", f"Native file events unavailable, polling instead: {e}")
+
+    seen = stat_documents(doc_path)  # baseline taken before returning, so no change slips past
+    threading.Thread(target=poll_documents, args=(doc_path, seen), name="watch-poll", daemon=True).start()
+    mcp_log("WATCH", f"Polling {doc_path} every {WATCH_POLL_SECONDS:g}s")
 
 
 if __name__ == "__main__":
     print("STARTING THE SERVER AT AMAZING LOCATION")
 
+    # Index in the background; searches use the last published snapshot meanwhile
+    start_indexing_worker()
+    request_indexing()
+    if WATCH_DOCUMENTS:
+        start_document_watcher()
+
     if len(sys.argv) > 1 and sys.argv[1] == "dev":
         mcp.run() # Run without transport for dev server
     else:
-        # Start the server in a separate thread
-        import threading
-        server_thread = threading.Thread(target=lambda: mcp.run(transport="stdio"))
-        server_thread.daemon = True
-        server_thread.start()
-        
-        # Wait a moment for the server to start
-        time.sleep(2)
-        
-        # Process documents after server is running
-        process_documents()
-        
-        # Keep the main thread alive
-        try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            print("\nShutting down...")
+        mcp.run(transport="stdio")
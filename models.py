@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 
 # Input/Output models for tools
 
@@ -49,6 +49,24 @@ class MarkdownOutput(BaseModel):
 class ChunkListOutput(BaseModel):
     chunks: List[str]
 
+class SearchHit(BaseModel):
+    text: str
+    doc: str
+    chunk_id: str
+    collection: str
+    start: int  # character span of text within the stored chunk
+    end: int
+    score: float  # ranking score: RRF (hybrid), similarity (dense) or BM25 (lexical)
+    similarity: Optional[float] = None  # cosine similarity to the query
+    bm25: Optional[float] = None
+    term_coverage: Optional[float] = None  # share of the query's terms the chunk contains (lexical match)
+    sources: List[str] = []
+
+class SearchDocumentsOutput(BaseModel):
+    query: str
+    relevant: bool
+    hits: List[SearchHit]
+
 class ShellCommandInput(BaseModel):
     command: str
 
@@ -70,6 +70,8 @@ Respond in **exactly one line** using one of the following formats:
 
 - 🚫 Do NOT invent tools. Use only the tools listed above. Tool description has useage pattern, only use that.
 - 📄 If the question may relate to public/factual knowledge (like companies, people, places), use the `search_documents` tool to look for the answer.
+- 📚 If you need facts about several entities, search them together in ONE call: `search_documents_batch|queries=["entity one ...", "entity two ..."]`.
+- 🔍 A search result starting with NO_RELEVANT_RESULTS means the documents don't cover it: do NOT search the documents again; use another tool or answer.
 - 🧮 If the question is mathematical, use the appropriate math tool.
 - 🔁 Analyze that whether you have already got a good factual result from a tool, do NOT search again — summarize and respond with FINAL_ANSWER.
 - ❌ NEVER repeat tool calls with the same parameters unless the result was empty. When searching rely on first reponse from tools, as that is the best response probably.
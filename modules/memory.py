@@ -9,6 +9,8 @@
 
 # Filter memory based on type/tags/session
 
+# Expire, evict and merge memories per type (TTL, capacity, near-duplicates)
+
 # Dependencies:
 
 # faiss, requests, pydantic
@@ -21,9 +23,12 @@
 
 # modules/memory.py
 
-from typing import List, Optional, Literal
+from typing import List, Optional, Literal, Dict, Set
+from collections import defaultdict
 from pydantic import BaseModel
 from datetime import datetime
+import threading
+import time
 import requests
 import numpy as np
 import faiss
@@ -39,31 +44,398 @@ class MemoryItem(BaseModel):
     session_id: Optional[str] = None
 
 
+# Vector encodings for the compact storage modes (codes live only inside FAISS)
+STORAGE_CODECS = {"float32": "Flat", "float16": "SQfp16", "sq8": "SQ8", "pq": "PQ{pq_m}"}
+
+
+def compose_factory(index_factory: str, storage: str = "float32", rerank: bool = False, pq_m: int = 32) -> str:
+    """Swap the vector encoding of a factory string for a compact one, optionally re-ranking with exact vectors."""
+    codec = STORAGE_CODECS[storage].format(pq_m=pq_m)
+    parts = [part.strip() for part in index_factory.split(",")]
+    if storage != "float32":
+        if parts == ["Flat"] and storage == "pq":
+            # IndexPQ rejects every SearchParameters (so id selectors); one IVF list scans the same codes and takes them
+            parts = ["IVF1", codec]
+        elif parts[-1] == "Flat":
+            parts[-1] = codec
+        elif parts[-1].startswith("HNSW"):
+            parts.append(codec)
+    if rerank and parts != ["Flat"] and parts[-1] != "RFlat":
+        parts.append("RFlat")
+    return ",".join(parts)
+
+
+def create_index(index_factory: str, dim: int) -> faiss.Index:
+    """Build an L2 index from a FAISS factory string (Flat, HNSW32, IVF1024,Flat, IVF1024,PQ32...)."""
+    return faiss.index_factory(dim, index_factory, faiss.METRIC_L2)
+
+
+def search_params(
+    index: faiss.Index,
+    selector: Optional[faiss.IDSelector] = None,
+    nprobe: int = 16,
+    ef_search: int = 64,
+    exhaustive: bool = False,
+    k_factor: int = 4
+) -> Optional[faiss.SearchParameters]:
+    """Per-query search parameters for the index family, optionally scanning everything."""
+    if isinstance(index, faiss.IndexRefine):
+        base = faiss.downcast_index(index.base_index)
+        return faiss.IndexRefineSearchParameters(
+            k_factor=k_factor,
+            base_index_params=search_params(base, selector, nprobe, ef_search, exhaustive)
+        )
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(
+            sel=selector, nprobe=ivf.nlist if exhaustive else min(nprobe, ivf.nlist)
+        )
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(
+            sel=selector, efSearch=max(ef_search, index.ntotal) if exhaustive else ef_search
+        )
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+
+def is_approximate(index: Optional[faiss.Index]) -> bool:
+    if isinstance(index, faiss.IndexRefine):
+        index = faiss.downcast_index(index.base_index)
+    return index is not None and (
+        faiss.try_extract_index_ivf(index) is not None or isinstance(index, faiss.IndexHNSW)
+    )
+
+
 class MemoryManager:
-    def __init__(self, embedding_model_url: str, model_name: str = "nomic-embed-text"):
+    def __init__(
+        self,
+        embedding_model_url: str,
+        model_name: str = "nomic-embed-text",
+        index_factory: str = "Flat",
+        nprobe: int = 16,
+        ef_search: int = 64,
+        train_size: int = 0,
+        storage: str = "float32",
+        pq_m: int = 32,
+        rerank: bool = False,
+        rerank_k_factor: int = 4,
+        write_behind: bool = False,
+        write_batch_size: int = 16,
+        embedding_batch_url: Optional[str] = None,
+        lifecycle: Optional[Dict[str, Dict[str, float]]] = None,
+        dedup_threshold: float = 0.0,
+        compact_ratio: float = 0.25
+    ):
         self.embedding_model_url = embedding_model_url
+        self.embedding_batch_url = embedding_batch_url  # e.g. Ollama /api/embed (list input)
         self.model_name = model_name
-        self.index: Optional[faiss.IndexFlatL2] = None
-        self.data: List[MemoryItem] = []
-        self.embeddings: List[np.ndarray] = []
+        self.http = requests.Session()
+        # Embeddings are kept once, encoded inside the FAISS index
+        self.index_factory = compose_factory(index_factory, storage, rerank, pq_m)
+        self.rerank_k_factor = rerank_k_factor
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.train_size = train_size  # 0 → derived from the index (e.g. 39 * nlist for IVF)
+        self.index: Optional[faiss.Index] = None
+        self._untrained: Optional[faiss.Index] = None  # target index waiting for enough vectors
+        # Slot i holds the item stored at FAISS id i; evicted slots are None until compaction
+        self.data: List[Optional[MemoryItem]] = []
+        self._live_count = 0
+
+        # Lifecycle: per-type {max_items, ttl_seconds}, near-duplicate merging, amortized compaction
+        self.lifecycle = lifecycle or {}
+        self.dedup_threshold = dedup_threshold  # cosine similarity; 0 disables merging
+        self.compact_ratio = compact_ratio
+        self._created: List[float] = []
+        self._last_used: List[float] = []
+        self._hits: List[int] = []
+
+        # Inverted id sets so filtered retrieval only searches matching memories
+        self.type_ids: Dict[str, Set[int]] = defaultdict(set)
+        self.tag_ids: Dict[str, Set[int]] = defaultdict(set)
+        self.session_ids: Dict[str, Set[int]] = defaultdict(set)
+
+        # Write-behind: add() queues items, a background thread embeds and inserts them in batches
+        self.write_behind = write_behind
+        self.write_batch_size = write_batch_size
+        self._lock = threading.RLock()  # guards index, data and id sets
+        self._pending: List[MemoryItem] = []  # queued, not yet searchable
+        self._pending_cv = threading.Condition()
+        self._writer: Optional[threading.Thread] = None
 
     def _get_embedding(self, text: str) -> np.ndarray:
-        response = requests.post(
+        if self.embedding_batch_url:
+            # Same endpoint as batched writes: /api/embed normalizes, /api/embeddings does not
+            return self._get_embeddings([text])[0]
+        response = self.http.post(
             self.embedding_model_url,
             json={"model": self.model_name, "prompt": text}
         )
         response.raise_for_status()
         return np.array(response.json()["embedding"], dtype=np.float32)
 
+    def _get_embeddings(self, texts: List[str]) -> List[np.ndarray]:
+        if not self.embedding_batch_url:
+            return [self._get_embedding(text) for text in texts]
+        response = self.http.post(
+            self.embedding_batch_url,
+            json={"model": self.model_name, "input": texts}
+        )
+        response.raise_for_status()
+        return [np.array(e, dtype=np.float32) for e in response.json()["embeddings"]]
+
+    def _min_training_size(self, index: faiss.Index) -> int:
+        ivf = faiss.try_extract_index_ivf(index)
+        floor = ivf.nlist if ivf is not None else 1
+        if "PQ" in self.index_factory.upper():
+            floor = max(floor, 39 * 256)  # FAISS wants ~39 points per 8-bit PQ centroid
+        if self.train_size:
+            return max(self.train_size, floor)
+        return max(floor, ivf.nlist * 39 if ivf is not None else 1000)
+
+    def _init_index(self, dim: int):
+        index = create_index(self.index_factory, dim)
+        if index.is_trained:
+            self.index = index
+            self._enable_reconstruct(index)
+        else:
+            # Serve exact search from a flat index until there is enough data to train
+            self._untrained = index
+            self.index = faiss.IndexFlatL2(dim)
+
+    def _maybe_train(self):
+        if self._untrained is None or self.index.ntotal < self._min_training_size(self._untrained):
+            return
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        self._untrained.train(vectors)
+        self._enable_reconstruct(self._untrained)
+        self._untrained.add(vectors)
+        self.index, self._untrained = self._untrained, None
+
+    @staticmethod
+    def _enable_reconstruct(index: faiss.Index):
+        # IVF indexes need a direct map to reconstruct vectors for dedup and compaction
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None and ivf.is_trained:
+            ivf.make_direct_map()
+
+    def _insert(self, items: List[MemoryItem], embeddings: List[np.ndarray]):
+        with self._lock:
+            now = time.time()
+            fresh_items, fresh_slots, fresh_vectors = [], [], []
+            for item, embedding in zip(items, embeddings):
+                if self._merge_duplicate(item, embedding, now):
+                    continue
+                # The index doesn't hold this batch yet: repeats within it are matched here
+                slot = self._batch_duplicate(item, embedding, fresh_slots, fresh_vectors)
+                if slot is not None:
+                    self._fold(slot, item, now)
+                    continue
+                slot = len(self.data)
+                self._index_attributes(slot, item)
+                self.data.append(item)
+                self._created.append(now)
+                self._last_used.append(now)
+                self._hits.append(0)
+                self._live_count += 1
+                fresh_items.append(item)
+                fresh_slots.append(slot)
+                fresh_vectors.append(embedding)
+
+            if fresh_vectors:
+                # Init or add to index
+                if self.index is None:
+                    self._init_index(len(fresh_vectors[0]))
+                self.index.add(np.stack(fresh_vectors))
+                self._maybe_train()
+
+            self._enforce_lifecycle(now)
+
+    def _merge_duplicate(self, item: MemoryItem, embedding: np.ndarray, now: float) -> bool:
+        """Fold a near-identical memory of the same type/session into its existing slot."""
+        if self.dedup_threshold <= 0 or self.index is None:
+            return False
+        candidates = self._candidate_ids(item.type, None, item.session_id)
+        if not candidates:
+            return False
+
+        selector = faiss.IDSelectorBatch(np.fromiter(candidates, dtype=np.int64))
+        params = search_params(
+            self.index, selector, self.nprobe, self.ef_search, k_factor=self.rerank_k_factor
+        )
+        _, I = self.index.search(embedding.reshape(1, -1), 1, params=params)
+        slot = int(I[0][0])
+        if slot < 0 or self.data[slot] is None:
+            return False
+
+        existing = self.index.reconstruct(slot)
+        denom = float(np.linalg.norm(existing) * np.linalg.norm(embedding)) or 1.0
+        if float(np.dot(existing, embedding)) / denom < self.dedup_threshold:
+            return False
+        self._fold(slot, item, now)
+        return True
+
+    def _batch_duplicate(
+        self, item: MemoryItem, embedding: np.ndarray, slots: List[int], vectors: List[np.ndarray]
+    ) -> Optional[int]:
+        """Slot of a near-identical memory of the same type/session inserted earlier in the same batch."""
+        if self.dedup_threshold <= 0:
+            return None
+        same = [
+            i for i, slot in enumerate(slots)
+            if self.data[slot].type == item.type and (not item.session_id or self.data[slot].session_id == item.session_id)
+        ]
+        if not same:
+            return None
+        matrix = np.stack([vectors[i] for i in same])
+        similarity = matrix @ embedding / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(embedding) + 1e-12)
+        best = int(np.argmax(similarity))
+        return slots[same[best]] if similarity[best] >= self.dedup_threshold else None
+
+    def _fold(self, slot: int, item: MemoryItem, now: float):
+        # Keep the newest text and treat the repeat as a fresh sighting
+        self._unindex_attributes(slot, self.data[slot])
+        self._index_attributes(slot, item)
+        self.data[slot] = item
+        self._created[slot] = now
+        self._last_used[slot] = now
+        self._hits[slot] += 1
+
+    def _enforce_lifecycle(self, now: float):
+        """Expire items past their type's TTL and evict the least useful beyond its capacity."""
+        for mem_type, policy in self.lifecycle.items():
+            slots = self.type_ids.get(mem_type)
+            if not slots:
+                continue
+            ttl = policy.get("ttl_seconds")
+            if ttl:
+                for slot in [s for s in slots if now - self._created[s] > ttl]:
+                    self._evict(slot)
+            max_items = policy.get("max_items")
+            if max_items and len(slots) > max_items:
+                # Least retrieved first, least recently used breaks ties
+                ranked = sorted(slots, key=lambda s: (self._hits[s], self._last_used[s]))
+                for slot in ranked[:len(slots) - int(max_items)]:
+                    self._evict(slot)
+
+        dead = len(self.data) - self._live_count
+        if dead and dead >= self.compact_ratio * len(self.data):
+            self._compact()
+
+    def _evict(self, slot: int):
+        # Tombstone only; the vector stays in FAISS until the next compaction
+        self._unindex_attributes(slot, self.data[slot])
+        self.data[slot] = None
+        self._live_count -= 1
+
+    def _compact(self):
+        """Rebuild the index from live slots, reusing the trained index structure."""
+        live = [slot for slot, item in enumerate(self.data) if item is not None]
+        vectors = np.stack([self.index.reconstruct(slot) for slot in live]) if live else None
+
+        fresh = faiss.clone_index(self.index)
+        fresh.reset()
+        self._enable_reconstruct(fresh)
+        if vectors is not None:
+            fresh.add(vectors)
+        self.index = fresh
+
+        self.data = [self.data[slot] for slot in live]
+        self._created = [self._created[slot] for slot in live]
+        self._last_used = [self._last_used[slot] for slot in live]
+        self._hits = [self._hits[slot] for slot in live]
+        self.type_ids.clear()
+        self.tag_ids.clear()
+        self.session_ids.clear()
+        for slot, item in enumerate(self.data):
+            self._index_attributes(slot, item)
+
     def add(self, item: MemoryItem):
-        embedding = self._get_embedding(item.text)
-        self.embeddings.append(embedding)
-        self.data.append(item)
+        if not self.write_behind:
+            self._insert([item], [self._get_embedding(item.text)])
+            return
+
+        with self._pending_cv:
+            self._pending.append(item)
+            self._pending_cv.notify_all()
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="memory-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            with self._pending_cv:
+                while not self._pending:
+                    self._pending_cv.wait()
+                batch = self._pending[:self.write_batch_size]
+
+            try:
+                self._insert(batch, self._get_embeddings([item.text for item in batch]))
+            except Exception as e:
+                print(f"[memory] ⚠️ Background write of {len(batch)} items failed: {e}")
+
+            # Items leave the pending list only once searchable (or dropped on error)
+            with self._pending_cv:
+                del self._pending[:len(batch)]
+                self._pending_cv.notify_all()
+
+    def flush(self, type_filter: Optional[str] = None, tag_filter: Optional[List[str]] = None,
+              session_filter: Optional[str] = None):
+        """Read-your-writes barrier: wait until no queued item matching the filters is pending."""
+        def blocking() -> bool:
+            return any(
+                self._matches(item, type_filter, tag_filter, session_filter) for item in self._pending
+            )
+
+        with self._pending_cv:
+            self._pending_cv.wait_for(lambda: not blocking())
+
+    @staticmethod
+    def _matches(item: MemoryItem, type_filter: Optional[str], tag_filter: Optional[List[str]],
+                 session_filter: Optional[str]) -> bool:
+        if type_filter and type_filter != "all" and item.type != type_filter:
+            return False
+        if tag_filter and not any(tag in item.tags for tag in tag_filter):
+            return False
+        if session_filter and item.session_id != session_filter:
+            return False
+        return True
 
-        # Init or add to index
-        if self.index is None:
-            self.index = faiss.IndexFlatL2(len(embedding))
-        self.index.add(np.stack([embedding]))
+    def _index_attributes(self, idx: int, item: MemoryItem):
+        self.type_ids[item.type].add(idx)
+        for tag in item.tags:
+            self.tag_ids[tag].add(idx)
+        if item.session_id:
+            self.session_ids[item.session_id].add(idx)
+
+    def _unindex_attributes(self, idx: int, item: MemoryItem):
+        self.type_ids[item.type].discard(idx)
+        for tag in item.tags:
+            self.tag_ids[tag].discard(idx)
+        if item.session_id:
+            self.session_ids[item.session_id].discard(idx)
+
+    def _candidate_ids(
+        self,
+        type_filter: Optional[str] = None,
+        tag_filter: Optional[List[str]] = None,
+        session_filter: Optional[str] = None
+    ) -> Optional[Set[int]]:
+        """Return ids matching every filter, or None when nothing is filtered."""
+        candidates: Optional[Set[int]] = None
+
+        def narrow(ids: Set[int]):
+            nonlocal candidates
+            candidates = set(ids) if candidates is None else candidates & ids
+
+        if type_filter and type_filter != "all":
+            narrow(self.type_ids.get(type_filter, set()))
+        if tag_filter:
+            narrow(set().union(*(self.tag_ids.get(tag, set()) for tag in tag_filter)))
+        if session_filter:
+            narrow(self.session_ids.get(session_filter, set()))
+        return candidates
 
     def retrieve(
         self,
@@ -73,31 +445,65 @@ class MemoryManager:
         tag_filter: Optional[List[str]] = None,
         session_filter: Optional[str] = None
     ) -> List[MemoryItem]:
-        if not self.index or len(self.data) == 0:
+        if not self._live_count and not self._pending:
             return []
 
+        # Embed the query while queued writes finish, then wait only for the ones we could return
         query_vec = self._get_embedding(query).reshape(1, -1)
-        D, I = self.index.search(query_vec, top_k * 2)  # overfetch for filtering
+        self.flush(type_filter, tag_filter, session_filter)
 
-        results = []
-        for idx in I[0]:
-            if idx >= len(self.data):
-                continue
-            item = self.data[idx]
+        with self._lock:
+            now = time.time()
+            self._enforce_lifecycle(now)
+            if not self.index or self._live_count == 0:
+                return []
 
-            if type_filter and item.type != type_filter:
-                continue
-            if tag_filter and not any(tag in item.tags for tag in tag_filter):
-                continue
-            if session_filter and item.session_id != session_filter:
-                continue
+            candidates = self._candidate_ids(type_filter, tag_filter, session_filter)
+            if candidates is None and self._live_count < len(self.data):
+                # Unfiltered search still has to skip evicted slots
+                candidates = {slot for slot, item in enumerate(self.data) if item is not None}
+            if candidates is not None and not candidates:
+                return []
+
+            # Filter inside FAISS via an id selector: every hit already matches,
+            # so top_k is filled whenever enough matching memories exist.
+            selector = None
+            k = min(top_k, self._live_count)
+            if candidates is not None and len(candidates) < len(self.data):
+                selector = faiss.IDSelectorBatch(np.fromiter(candidates, dtype=np.int64))
+                k = min(top_k, len(candidates))
+
+            params = search_params(self.index, selector, self.nprobe, self.ef_search, k_factor=self.rerank_k_factor)
+            D, I = self.index.search(query_vec, k, params=params)
+
+            # ANN indexes can come up short under a selective filter; rescan exhaustively
+            if is_approximate(self.index) and (I[0] >= 0).sum() < k:
+                params = search_params(
+                    self.index, selector, self.nprobe, self.ef_search,
+                    exhaustive=True, k_factor=self.rerank_k_factor
+                )
+                D, I = self.index.search(query_vec, k, params=params)
 
-            results.append(item)
-            if len(results) >= top_k:
-                break
+            results = []
+            for idx in I[0]:
+                if 0 <= idx < len(self.data) and self.data[idx] is not None:
+                    self._hits[idx] += 1
+                    self._last_used[idx] = now
+                    results.append(self.data[idx])
+            return results
 
-        return results
+    def memory_footprint(self) -> Dict[str, int]:
+        """Serialized size of the vector index (diagnostics only; copies the index)."""
+        with self._lock:
+            n = self.index.ntotal if self.index is not None else 0
+            index_bytes = faiss.serialize_index(self.index).nbytes if n else 0
+        return {
+            "items": self._live_count,
+            "index_bytes": int(index_bytes),
+            "bytes_per_vector": int(index_bytes // n) if n else 0
+        }
 
     def bulk_add(self, items: List[MemoryItem]):
-        for item in items:
-            self.add(item)
+        for start in range(0, len(items), self.write_batch_size):
+            batch = items[start:start + self.write_batch_size]
+            self._insert(batch, self._get_embeddings([item.text for item in batch]))